@@ -25,7 +25,7 @@ class Config:
     PHONE_NUMBER_TWO = environ.get("PHONE_NUMBER_TWO")
     MAIL_SERVER = environ.get('MAIL_SERVER')
     FLASKY_ADMIN = environ.get('FLASKY_ADMIN')
-    MAIL_POST = int(environ.get('MAIL_POST', '587'))
+    MAIL_PORT = int(environ.get('MAIL_PORT', environ.get('MAIL_POST', '587')))
     MAIL_USE_TLS = environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
 
     MAIL_SENDER = environ.get('MAIL_SENDER')
@@ -33,10 +33,103 @@ class Config:
     MAIL_USERNAME = environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = environ.get('MAIL_PASSWORD')
     MAIL_SUBJECT_PREFIX = environ.get("MAIL_SUBJECT")
+    MAIL_OUTBOX_ENABLED = environ.get('MAIL_OUTBOX_ENABLED', 'true').lower() in ['true', 'on', '1']
+    MAIL_OUTBOX_POLL = 10
+    MAIL_OUTBOX_BATCH = 20
+    MAIL_OUTBOX_RATE = float(environ.get('MAIL_OUTBOX_RATE', '2'))
+    MAIL_OUTBOX_MAX_ATTEMPTS = 5
+    MAIL_OUTBOX_BACKOFF = 30
+    MAIL_OUTBOX_IDLE = 60
+    MAIL_OUTBOX_TIMEOUT = 600
+    MAIL_OUTBOX_LOCK_FILE = path.join(BASE_DIR, 'outbox.lock')
+    CONTACT_DIGEST_WINDOW = int(environ.get('CONTACT_DIGEST_WINDOW', '3600'))
+    CONTACT_GROUP_COMMIT = environ.get('CONTACT_GROUP_COMMIT', 'false').lower() in ['true', 'on', '1']
+    CONTACT_GROUP_COMMIT_DELAY = int(environ.get('CONTACT_GROUP_COMMIT_DELAY', '5'))
+    CONTACT_GROUP_COMMIT_SIZE = 50
+    CONTACT_GROUP_COMMIT_TIMEOUT = 10
+    LOG_MAIL_LIMIT = 10
+    LOG_MAIL_PERIOD = 3600
+    LOG_MAIL_DEDUPE_WINDOW = 600
+    TIMING_ENABLED = environ.get('TIMING_ENABLED', 'true').lower() in ['true', 'on', '1']
+    TIMING_LOG = environ.get('TIMING_LOG', 'true').lower() in ['true', 'on', '1']
+    TIMING_LOG_FILE = environ.get('TIMING_LOG_FILE')
+    SERVER_TIMING_HEADER = environ.get('SERVER_TIMING_HEADER', 'false').lower() in ['true', 'on', '1']
+    SLOW_REQUEST_THRESHOLD = int(environ.get('SLOW_REQUEST_THRESHOLD', '500'))
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto/-Host are trusted.
+    # Only set it when nginx always fronts the app and overwrites these headers: without
+    # a proxy any client could forge them and pick its own IP for the rate limiter and /metrics.
+    TRUSTED_PROXIES = int(environ.get('TRUSTED_PROXIES', '0'))
+    METRICS_ENABLED = environ.get('METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_DIR = environ.get('METRICS_DIR') or path.join(BASE_DIR, 'metrics')
+    METRICS_TOKEN = environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip for ip in environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+    METRICS_FLUSH_INTERVAL = 5
+    ADMIN_PER_PAGE = 20
+    NPLUSONE_ENABLED = False
+    NPLUSONE_THRESHOLD = 3
+    NPLUSONE_RAISE = False
 
     MAX_CONTENT_LENGTH = 16 * 1000 * 1000
     ALLOWED_EXTENSIONS = ['png', 'jpg', 'jpeg']
     UPLOAD_FOLDER_PATH = path.join(BASE_DIR, 'upload/')
+    USE_X_SENDFILE = environ.get('USE_X_SENDFILE', 'false').lower() in ['true', 'on', '1']
+    UPLOAD_ACCEL_REDIRECT = environ.get('UPLOAD_ACCEL_REDIRECT')
+    IMAGE_VARIANTS = {'thumb': 320, 'card': 640, 'full': 1280}
+    IMAGE_WORKER_ENABLED = environ.get('IMAGE_WORKER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    IMAGE_WORKERS = int(environ.get('IMAGE_WORKERS', '2'))
+    IMAGE_WORKER_POLL = 5
+    IMAGE_JOB_MAX_ATTEMPTS = 3
+    IMAGE_JOB_TIMEOUT = 600
+
+    SHOWCASE_CACHE_TTL = int(environ.get('SHOWCASE_CACHE_TTL', '300'))
+    CONTENT_VERSION_FILE = path.join(BASE_DIR, 'content.version')
+    IDENTITY_VERSION_FILE = path.join(BASE_DIR, 'identity.version')
+    LAST_SEEN_ENABLED = environ.get('LAST_SEEN_ENABLED', 'true').lower() in ['true', 'on', '1']
+    LAST_SEEN_FLUSH_INTERVAL = 60
+    LAST_SEEN_GRANULARITY = int(environ.get('LAST_SEEN_GRANULARITY', '300'))
+    PASSWORD_HASH_TARGET_MS = int(environ.get('PASSWORD_HASH_TARGET_MS', '250'))
+    PASSWORD_HASH_ROUNDS = int(environ['PASSWORD_HASH_ROUNDS']) if environ.get('PASSWORD_HASH_ROUNDS') else None
+    PASSWORD_HASH_MIN_ROUNDS = 10
+    PASSWORD_HASH_MAX_ROUNDS = 16
+    PASSWORD_HASH_WORKERS = int(environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_QUEUE = int(environ.get('PASSWORD_HASH_QUEUE', '8'))
+    PASSWORD_HASH_TIMEOUT = 10
+    RATELIMIT_ENABLED = environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATELIMIT_STORAGE = path.join(BASE_DIR, 'ratelimit.sqlite3')
+    # Buckets per scope: (capacity, seconds to refill it), by client IP and by submitted email.
+    RATELIMIT_RULES = {
+        'login': {'ip': (10, 60), 'email': (5, 300)},
+        'reset': {'ip': (5, 300), 'email': (3, 3600)},
+        'contact': {'ip': (5, 600), 'email': (3, 600)},
+    }
+    PAGE_CACHE_ENABLED = True
+    SITEMAP_MAX_URLS = 50000
+    # Canonical host of the absolute URLs (sitemap, robots.txt). Unset, the request's Host is used.
+    SERVER_NAME = environ.get('SERVER_NAME')
+    PREFERRED_URL_SCHEME = environ.get('PREFERRED_URL_SCHEME', 'http')
+    COMPRESS_ENABLED = environ.get('COMPRESS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_CACHE_SIZE = 64
+
+    ASSETS_FINGERPRINT = True
+    ASSETS_PURGE = ['css/all.min.css']
+    ASSETS_SUBSETS = {'css/all.min.css': 'css/fontawesome.subset.css'}
+    ASSETS_EXCLUDE = ['webfonts/*.eot', 'webfonts/*.svg', 'webfonts/*.ttf', 'webfonts/*.woff']
+    ASSETS_BUNDLES = {
+        'public': {
+            'css': ['css/all.min.css', 'css/custom.css'],
+            'js': [
+                'js/jquery.min.js', 'js/popper.min.js', 'js/bootstrap.min.js',
+                'js/owl.carousel.min.js', 'js/custom.js'
+            ],
+        },
+        'admin': {
+            'css': ['admin/css/theme.min.css', 'admin/fonts/feather/feather.css'],
+            'js': ['admin/js/jquery.min.js', 'admin/js/bootstrap.bundle.min.js', 'admin/js/theme.min.js'],
+        },
+    }
 
     @staticmethod
     def init_app(app):
@@ -46,11 +139,18 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     DEVELOPMENT = True
+    PAGE_CACHE_ENABLED = environ.get('PAGE_CACHE_ENABLED', 'false').lower() in ['true', 'on', '1']
+    ASSETS_FINGERPRINT = environ.get('ASSETS_FINGERPRINT', 'false').lower() in ['true', 'on', '1']
+    SERVER_TIMING_HEADER = True
+    NPLUSONE_ENABLED = environ.get('NPLUSONE_ENABLED', 'false').lower() in ['true', 'on', '1']
+    NPLUSONE_RAISE = environ.get('NPLUSONE_RAISE', 'false').lower() in ['true', 'on', '1']
     SQLALCHEMY_DATABASE_URI = environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + path.join(BASE_DIR, 'dev.sqlite3')
 
 
 class ProductionConfig(Config):
+    TIMING_LOG = environ.get('TIMING_LOG', 'false').lower() in ['true', 'on', '1']
+    PREFERRED_URL_SCHEME = environ.get('PREFERRED_URL_SCHEME', 'https')
     SQLALCHEMY_DATABASE_URI = environ.get('DATABASE_URL') or \
         'sqlite:///' + path.join(BASE_DIR, 'prod.sqlite3')
 
@@ -59,7 +159,7 @@ class ProductionConfig(Config):
         Config.init_app(app)
 
         import logging
-        from logging.handlers import SMTPHandler
+        from core.logs import ThrottledSMTPHandler
 
         credentials = None
         secure = None
@@ -69,13 +169,16 @@ class ProductionConfig(Config):
             if getattr(cls, 'MAIL_USE_TLS', None):
                 secure = ()
 
-        mail_handler = SMTPHandler(
+        mail_handler = ThrottledSMTPHandler(
             mailhost=(cls.MAIL_SERVER, cls.MAIL_PORT),
             fromaddr=cls.MAIL_SENDER,
             toaddrs=[cls.FLASKY_ADMIN],
-            subject=cls.MAIL_SUBJECT_PREFIX + ' Application Error',
+            subject=(cls.MAIL_SUBJECT_PREFIX or '') + ' Application Error',
             credentials=credentials,
-            secure=secure
+            secure=secure,
+            limit=cls.LOG_MAIL_LIMIT,
+            period=cls.LOG_MAIL_PERIOD,
+            window=cls.LOG_MAIL_DEDUPE_WINDOW
         )
         mail_handler.setLevel(logging.ERROR)
         app.logger.addHandler(mail_handler)
@@ -6,23 +6,43 @@ import os
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
-from flask import Flask, current_app, render_template
+from flask import Flask, current_app, render_template, make_response
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from flask_mail import Mail
 from flask_moment import Moment
-from flask_bcrypt import Bcrypt
 from flask_ckeditor import CKEditor
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 
 from config import config
+from .cache import ShowcaseCache, PageCache
+from .assets import Assets, assets_cli
+from .compress import CompressionMiddleware
+from .logs import setup_logging
+from .timing import RequestTimer
+from .metrics import Metrics
+from .nplusone import QueryAuditor
+from .identity import IdentityCache
+from .presence import LastSeenBuffer
+from .passwords import PasswordHasher
+from .ratelimit import RateLimiter
 
 
 mail = Mail()
 db = SQLAlchemy()
 moment = Moment()
-bcrypt = Bcrypt()
 ckeditor = CKEditor()
+cache = ShowcaseCache()
+page_cache = PageCache(cache)
+assets = Assets()
+request_timer = RequestTimer()
+metrics = Metrics()
+query_auditor = QueryAuditor()
+identity = IdentityCache()
+presence = LastSeenBuffer()
+passwords = PasswordHasher()
+limiter = RateLimiter()
 login_manager = LoginManager()
 
 login_manager.login_view = 'admin.loginPage'
@@ -38,9 +58,33 @@ def create_app(config_name):
 
     mail.init_app(app)
     moment.init_app(app)
-    bcrypt.init_app(app)
+    passwords.init_app(app)
+    limiter.init_app(app)
     ckeditor.init_app(app)
     login_manager.init_app(app)
+    cache.init_app(app)
+    page_cache.init_app(app)
+    assets.init_app(app)
+    request_timer.init_app(app)
+    metrics.init_app(app)
+    query_auditor.init_app(app)
+    identity.init_app(app)
+    presence.init_app(app)
+    app.cli.add_command(assets_cli)
+
+    if app.config['TRUSTED_PROXIES']:
+        # Client IP, scheme and host as nginx saw them, for the rate limiter and /metrics.
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+    if app.config['COMPRESS_ENABLED']:
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config['COMPRESS_MIN_SIZE'],
+            level=app.config['COMPRESS_LEVEL'],
+            brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+            cache_size=app.config['COMPRESS_CACHE_SIZE']
+        )
 
     db.init_app(app)
 
@@ -52,6 +96,34 @@ def create_app(config_name):
         from .admin import admin as admin_blueprint
         app.register_blueprint(admin_blueprint)
 
+        from .main.models import Category, Project, Storie, Client
+        from .media.models import ImageVariant
+        cache.watch(Category, Project, Storie, Client, ImageVariant)
+
+        from .media.store import track_references
+        track_references(Project, Storie, Client)
+
+        from .admin.models import User, Role
+        identity.watch(User, Role)
+
+        from .media.worker import image_worker
+        from .media.cli import images as images_cli
+        image_worker.init_app(app)
+        app.cli.add_command(images_cli)
+
+        from .outbox.worker import mail_worker
+        from .outbox.cli import outbox as outbox_cli
+        mail_worker.init_app(app)
+        app.cli.add_command(outbox_cli)
+
+        from .contact.batch import contact_batcher
+        from .contact.cli import contact as contact_cli
+        contact_batcher.init_app(app)
+        app.cli.add_command(contact_cli)
+
+        from .explain import queries as queries_cli
+        app.cli.add_command(queries_cli)
+
         @app.errorhandler(404)
         def pageNotFound(error):
             page_title = f"{error.code} - page non trouvé"
@@ -79,23 +151,32 @@ def create_app(config_name):
                 error=error
             ), 400
 
-        @app.before_request
-        def log_entry():
-            app.logger.debug("Demande de traitement")
-
+        @app.errorhandler(429)
+        def tooManyRequests(error):
+            page_title = f"{error.code} - trop de tentatives, réessayez plus tard"
+            response = make_response(render_template(
+                'page/error.html',
+                page_title=page_title,
+                error=error
+            ), 429)
+            if error.retry_after is not None:
+                response.headers['Retry-After'] = str(error.retry_after)
+            return response
 
         @app.context_processor
         def context_processor():
-            from .admin.routes import categories, projects, clients, stories
+            from .admin.routes import(
+                categories, projects, clients, stories,
+                project_cards, storie_cards, client_cards
+            )
+            from .media.models import image_variants
             return dict(
                 categories=categories, projects=projects,
-                clients=clients, stories=stories
+                clients=clients, stories=stories,
+                project_cards=project_cards, storie_cards=storie_cards,
+                client_cards=client_cards, image_variants=image_variants
             )
 
-        @app.teardown_request
-        def log_exit(exc):
-            app.logger.debug("Traitement de la demande terminé", exc_info=exc)
-
         try:
             if not os.path.exists('upload'):
                 os.mkdir('upload')
@@ -109,16 +190,18 @@ def create_app(config_name):
             file_handler.setFormatter(logging.Formatter(
                 '''Time: %(asctime)s
                 Level: %(levelname)s
-                Method: %(message)s
+                Method: %(method)s
                 Path: %(url)s
                 IP: %(ip)s
                 User ID: %(user_id)s
                 Message: %(message)s
                 -----------------------'''))
 
-            file_handler.setLevel(logging.ERROR)
             file_handler.setLevel(logging.INFO)
             app.logger.addHandler(file_handler)
+
+        setup_logging(app)
+        if not app.debug:
             app.logger.info('running app')
 
         return app
@@ -61,7 +61,7 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField("Inscription")
 
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data.lower()).first()
+        user = User.find_by_email(email.data)
         if user:
             raise ValidationError(
                 f"""
@@ -89,7 +89,7 @@ class UpdateProfileForm(FlaskForm):
     def validate_email(self, email):
         if(
             email.data != current_user.email
-            and User.query.filter_by(email=email.data.lower()).first()
+            and User.find_by_email(email.data)
         ):
             raise ValidationError(
                 f"""
@@ -112,7 +112,7 @@ class ForgotPasswordForm(FlaskForm):
 
     def validate_email(self, email):
         email_data = email.data.lower()
-        user = User.query.filter_by(email=email_data).first()
+        user = User.find_by_email(email_data)
         if user is None:
             raise ValidationError(
                 f"""
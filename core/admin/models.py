@@ -8,12 +8,11 @@ from datetime import datetime
 
 from flask_login import UserMixin, AnonymousUserMixin
 from flask import current_app, redirect, flash, url_for, request
-from werkzeug.security import generate_password_hash, check_password_hash
 
 import jwt
 from . import admin
 from ..utils import Updateable
-from .. import db, login_manager
+from .. import db, login_manager, identity, presence, passwords
 from core.main.models import Project, Client, Storie
 
 
@@ -88,9 +87,9 @@ class User(Updateable, UserMixin, db.Model):
     )
     joined_at = db.Column(
         db.DateTime, nullable=False,
-        default=datetime.utcnow()
+        default=datetime.utcnow
     )
-    last_seen = db.Column(db.DateTime, default=datetime.utcnow())
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     role_id = db.Column(
         db.Integer, db.ForeignKey('roles.id'),
         nullable=True
@@ -122,6 +121,14 @@ class User(Updateable, UserMixin, db.Model):
     def __repr__(self):
         return f"User(id={self.id!r}, email={self.email!r}"
 
+    @staticmethod
+    def by_email(email):
+        return User.query.filter(db.func.lower(User.email) == email.lower())
+
+    @staticmethod
+    def find_by_email(email):
+        return User.by_email(email).first()
+
     def can(self, perm):
         return self.role is not None and self.role.has_permission(perm)
 
@@ -129,9 +136,7 @@ class User(Updateable, UserMixin, db.Model):
         return self.can(Permission.ADMIN)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        presence.touch(self.id)
 
     def change_email(self):
         self.image_file = self.gravatar_hash()
@@ -155,10 +160,15 @@ class User(Updateable, UserMixin, db.Model):
 
     @password_hash.setter
     def password_hash(self, password):
-        self.password = generate_password_hash(password_hash)
+        self.password = passwords.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password, password)
+        """Check ``password``, upgrading the stored hash when it is outdated."""
+        if not passwords.verify(self.password, password):
+            return False
+        if passwords.needs_rehash(self.password):
+            self.password_hash = password
+        return True
 
     def get_reset_password_token(self, expires_in=600):
         return jwt.encode(
@@ -177,6 +187,10 @@ class User(Updateable, UserMixin, db.Model):
         return User.query.get(id)
 
 
+# Case-insensitive lookups by email go through User.find_by_email.
+db.Index('ix_users_email_lower', db.func.lower(User.email))
+
+
 class AnonymousUser(AnonymousUserMixin):
 
     def can(self, permissions):
@@ -192,5 +206,5 @@ login_manager.anonymous_user = AnonymousUser
 @login_manager.user_loader
 def load_user(user_id):
     if user_id is not None:
-        return User.query.get(int(user_id))
+        return identity.load(int(user_id))
     return None
@@ -6,26 +6,38 @@ import os
 
 from flask import(
     render_template, redirect, request, abort,
-    flash, url_for, current_app, send_from_directory
+    flash, url_for, current_app, jsonify
 )
 from flask_login import(
     login_user, logout_user, login_required,
     current_user
 )
 from werkzeug.utils import secure_filename
+from sqlalchemy.orm import joinedload
 
 from . import admin
 from ..email import send_email
 from ..permissions import admin_required
 from .models import Permission, Role, User
-from .. import db, bcrypt, login_manager, mail
+from .. import db, login_manager, mail, cache, page_cache
+from ..passwords import PasswordHasherBusy
+from ..ratelimit import rate_limited
 from .forms import(
     RegistrationForm, LoginForm, ForgotPasswordForm,
     ResetPasswordForm, UpdateProfileForm
 )
-from .utils import save_picture
+from .utils import save_picture, send_upload
 from ..main.models import Category, Project, Storie, Client
 from ..main.forms import ProjectForm, StorieForm, ClientForm
+from ..contact.models import Contact
+from ..media.models import image_variants_for
+from ..pagination import keyset_paginate
+
+
+@admin.before_request
+def pingUser():
+    if current_user.is_authenticated:
+        current_user.ping()
 
 
 @admin.route('/', strict_slashes=False)
@@ -42,6 +54,7 @@ def dashboardPage():
 
 
 @admin.route("/login/", methods=['GET', 'POST'], strict_slashes=False)
+@rate_limited('login')
 def loginPage():
 
     if current_user.is_authenticated:
@@ -50,14 +63,17 @@ def loginPage():
     form = LoginForm()
     if form.validate_on_submit():
         try:
-            user = User.query.filter_by(email=form.email.data.lower()).first()
-            if user and bcrypt.check_password_hash(user.password, form.password.data):
+            user = User.find_by_email(form.email.data)
+            if user and user.verify_password(form.password.data):
+                db.session.commit()
                 login_user(user)
                 flash(f"Bienvenu ! Vous êtes connecté en tant que: {user.email.lower()}", "success")
                 return redirect(url_for('admin.dashboardPage'))
             else:
                 flash("Combinaison nom d'utilisateur/mot de passe invalide.", "danger")
                 return redirect(url_for('admin.loginPage'))
+        except PasswordHasherBusy:
+            abort(503)
         except:
             abort(400)
 
@@ -79,7 +95,7 @@ def registerPage():
     if form.validate_on_submit():
         try:
             user = User(email=form.email.data.lower())
-            user.password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            user.password_hash = form.password.data
             db.session.add(user)
             db.session.commit()
             msg_success = f"""
@@ -89,6 +105,8 @@ def registerPage():
             flash(msg_success, "success")
 
             return redirect(url_for('admin.loginPage'))
+        except PasswordHasherBusy:
+            abort(503)
         except:
             abort(400)
     if form.errors != {}:
@@ -113,7 +131,7 @@ def updateAccountPage():
         try:
             current_user.role = Role.query.get(form.role.data)
             current_user.email = form.email.data.lower()
-            db.session.add(current_user._get_current_object())
+            db.session.add(current_user.user)
             db.session.commit()
             flash("Votre compte a été mise à jour avec succès.", "success")
             return redirect(url_for('admin.updateAccountPage'))
@@ -147,13 +165,14 @@ def send_password_reset_email(user):
 
 
 @admin.route("/reset/password/request/", methods=['GET', 'POST'], strict_slashes=False)
+@rate_limited('reset')
 def resetRequestPage():
     if current_user.is_authenticated:
         return redirect(url_for('main.homePage'))
 
     form = ForgotPasswordForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.lower()).first()
+        user = User.find_by_email(form.email.data)
         if user:
             send_password_reset_email(user)
         flash(
@@ -179,12 +198,12 @@ def resetPasswordPage(token):
     form = ResetPasswordForm()
     try:
         if form.validate_on_submit():
-            hashed_password = bcrypt.generate_password_hash(
-                form.password.data).decode('utf-8')
-            user.password = hashed_password
+            user.password_hash = form.password.data
             db.session.commit()
             flash("Votre mot de passe a été mise à jour avec succès !", "success")
             return redirect(url_for('auth.loginPage'))
+    except PasswordHasherBusy:
+        abort(503)
     except Exception as e:
         return f"Une erreur s'est produite: {e}"
 
@@ -215,7 +234,7 @@ def addProjectPage():
                 name=form.name.data,
                 category=Category.query.get(form.category.data),
                 image=save_picture(form.image.data),
-                user=current_user._get_current_object()
+                user=current_user.user
             )
             db.session.add(picture)
             db.session.commit()
@@ -244,7 +263,7 @@ def addStoriePage():
                 status=form.status.data,
                 content=form.content.data,
                 image=save_picture(form.image.data),
-                user=current_user._get_current_object()
+                user=current_user.user
             )
             db.session.add(storie)
             db.session.commit()
@@ -271,7 +290,7 @@ def addClientPage():
             client = Client(
                 name=form.name.data,
                 image=save_picture(form.image.data),
-                user=current_user._get_current_object()
+                user=current_user.user
             )
             db.session.add(client)
             db.session.commit()
@@ -286,9 +305,55 @@ def addClientPage():
         page_title=page_title
     )
 
+def _listing(kind, model, query, page_title):
+    pagination = keyset_paginate(
+        query, model,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=current_app.config['ADMIN_PER_PAGE']
+    )
+    variants = image_variants_for(getattr(row, 'image', None) for row in pagination.items)
+    return render_template(
+        'admin/listing.html',
+        kind=kind,
+        pagination=pagination,
+        variants=variants,
+        page_title=page_title
+    )
+
+
+@admin.route('/projects/', strict_slashes=False)
+@login_required
+@admin_required
+def projectsPage():
+    query = Project.query.options(joinedload(Project.category), joinedload(Project.user))
+    return _listing('project', Project, query, 'Projets')
+
+
+@admin.route('/stories/', strict_slashes=False)
+@login_required
+@admin_required
+def storiesPage():
+    return _listing('storie', Storie, Storie.query, 'Témoignages')
+
+
+@admin.route('/clients/', strict_slashes=False)
+@login_required
+@admin_required
+def clientsPage():
+    return _listing('partner', Client, Client.query, 'Clients')
+
+
+@admin.route('/contacts/', strict_slashes=False)
+@login_required
+@admin_required
+def contactsPage():
+    return _listing('contact', Contact, Contact.query, 'Messages')
+
+
 @admin.route('/upload/<filename>/', strict_slashes=False)
 def upload(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER_PATH'], filename)
+    return send_upload(filename)
 
 
 @login_manager.unauthorized_handler
@@ -297,14 +362,56 @@ def unauthorized():
     return redirect(url_for('admin.loginPage'))
 
 
-def stories():
-    return Storie.query.order_by(Storie.timestamp.desc()).limit(8).all()
+@admin.route('/cache/', strict_slashes=False)
+@login_required
+@admin_required
+def cacheStats():
+    return jsonify(showcase=cache.stats(), pages=page_cache.stats())
+
+
+def _showcase(key, query):
+    def load():
+        rows = query().all()
+        for row in rows:
+            db.session.expunge(row)
+        return rows
+    return cache.get(key, load)
+
+def _eager(model, load):
+    """
+    Loader options for the relations named in ``load``. The rows are cached
+    detached from the session, so a relation not loaded here cannot be
+    lazy loaded later on.
+    """
+    return [joinedload(getattr(model, name)) for name in load]
+
+def _latest(model, load):
+    return model.query.options(*_eager(model, load)).order_by(model.timestamp.desc()).limit(8)
+
+def stories(load=('user',)):
+    return _showcase(('stories', load), lambda: _latest(Storie, load))
 
-def clients():
-    return Client.query.order_by(Client.timestamp.desc()).limit(8).all()
+def clients(load=('user',)):
+    return _showcase(('clients', load), lambda: _latest(Client, load))
 
-def projects():
-    return Project.query.order_by(Project.timestamp.desc()).limit(8).all()
+def projects(load=('category', 'user')):
+    return _showcase(('projects', load), lambda: _latest(Project, load))
 
 def categories():
-    return Category.query.order_by(Category.id.desc()).all()
+    return _showcase('categories', lambda: Category.query.order_by(Category.id.desc()))
+
+def project_cards():
+    """Columns the public page shows for the latest projects, category name included."""
+    return cache.get('project_cards', lambda: db.session.query(
+        Project.name, Project.image, Project.timestamp, Category.name.label('category')
+    ).join(Project.category).order_by(Project.timestamp.desc()).limit(8).all())
+
+def storie_cards():
+    return cache.get('storie_cards', lambda: db.session.query(
+        Storie.fullname, Storie.status, Storie.content, Storie.image, Storie.timestamp
+    ).order_by(Storie.timestamp.desc()).limit(8).all())
+
+def client_cards():
+    return cache.get('client_cards', lambda: db.session.query(
+        Client.name, Client.image
+    ).order_by(Client.timestamp.desc()).limit(8).all())
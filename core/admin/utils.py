@@ -4,11 +4,16 @@ Admin utils function.
 
 import os
 import imghdr
-import secrets
+import mimetypes
 
-from flask import current_app, request
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+from ..media.models import ImageJob
+from ..media.store import is_content_addressed, store_stream
+from ..media.worker import image_worker
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
@@ -19,7 +24,39 @@ def save_picture(picture):
     if picture and allowed_file(picture.filename):
         filename = secure_filename(picture.filename)
         _, extension = os.path.splitext(filename)
-        random_hex = secrets.token_hex(8)
-        picture_fn = random_hex + extension
-        picture.save(os.path.join(current_app.config['UPLOAD_FOLDER_PATH'], picture_fn))
+        picture_fn, created = store_stream(
+            picture.stream, extension, current_app.config['UPLOAD_FOLDER_PATH'])
+        if created or ImageJob.needed(picture_fn):
+            ImageJob.enqueue(picture_fn)
+            image_worker.wake()
         return picture_fn
+
+
+def send_upload(filename):
+    """
+    Serve an uploaded file. Content-addressed names never change content and
+    are cached for a year. With UPLOAD_ACCEL_REDIRECT set (e.g.
+    ``/_uploads/``, an ``internal`` nginx location aliased to the upload
+    folder) the bytes are sent by nginx; USE_X_SENDFILE does the same for
+    Apache/lighttpd.
+    """
+    folder = current_app.config['UPLOAD_FOLDER_PATH']
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+
+    if accel_prefix:
+        path = safe_join(folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+    else:
+        response = send_from_directory(folder, filename, conditional=True, etag=True)
+
+    if is_content_addressed(filename):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers.pop('Expires', None)
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    return response
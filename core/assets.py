@@ -0,0 +1,379 @@
+"""
+Fingerprinted and precompressed static assets.
+
+``flask assets build`` copies every file of the static folder to
+``static/dist`` under a name carrying its content hash, writes ``.gz`` (and
+``.br`` when brotli is installed) siblings and records the mapping in
+``dist/manifest.json``. Once the manifest exists ``url_for('static', ...)``
+returns the hashed names, which are served as immutable.
+
+The stylesheets and scripts of each page type (ASSETS_BUNDLES) are also
+concatenated and minified into one CSS and one JS bundle.
+
+``flask assets fonts`` subsets the Font Awesome woff2 files down to the
+glyphs used by the templates and writes a stylesheet that only references
+them; the bundles then use it in place of ``all.min.css``.
+"""
+
+import os
+import re
+import gzip
+import fnmatch
+import json
+import shutil
+import hashlib
+import posixpath
+import mimetypes
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.xml', '.ttf', '.eot', '.ico', '.map'}
+MIN_COMPRESS_SIZE = 1024
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CSS_IMPORT = re.compile(r'''@import\s+(?:url\([^)]*\)|"[^"]*"|'[^']*')[^;]*;''')
+CSS_CHARSET = re.compile(r'''@charset\s+["'][^"']*["']\s*;''')
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+CSS_RULE = re.compile(r'([^{}@]+)\{([^{}]*)\}')
+ICON_SELECTOR = re.compile(r'^\.(fa-[a-z0-9-]+):+before$')
+ICON_CLASS = re.compile(r'\bfa-[a-z0-9-]+')
+FONT_FACE = re.compile(r'@font-face\{([^}]*)\}')
+FONT_FILE = re.compile(r'webfonts/([\w-]+?)\.woff2')
+CSS_CONTENT = re.compile(r'content:\s*["\']((?:\\[0-9a-fA-F]+\s?)+)["\']')
+
+
+def minify_css(css):
+    css = CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    return rjsmin.jsmin(js) if rjsmin is not None else js
+
+
+def used_icons(*folders):
+    """Font Awesome classes referenced by the files under ``folders``."""
+    icons = set()
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(('.html', '.js', '.txt', '.xml')):
+                    with open(os.path.join(root, name), encoding='utf-8', errors='ignore') as fp:
+                        icons.update(ICON_CLASS.findall(fp.read()))
+    return icons
+
+
+def purge_icons(css, used):
+    """Drop the ``.fa-*:before`` glyph rules of ``css`` whose class is never used."""
+    def replace(match):
+        selectors = [sel.strip() for sel in match.group(1).split(',')]
+        icons = [ICON_SELECTOR.match(sel) for sel in selectors]
+        if not all(icons):
+            return match.group(0)
+        kept = [sel for sel, icon in zip(selectors, icons) if icon.group(1) in used]
+        if not kept:
+            return ''
+        return ','.join(kept) + '{' + match.group(2) + '}'
+
+    return CSS_RULE.sub(replace, css)
+
+
+def icon_codepoints(css, used):
+    """Codepoints of the glyphs ``css`` assigns to the ``used`` icon classes."""
+    codepoints = set()
+    for selectors, body in CSS_RULE.findall(css):
+        names = {match.group(1) for match in map(ICON_SELECTOR.match, selectors.split(',')) if match}
+        if names & used:
+            for content in CSS_CONTENT.findall(body):
+                codepoints.update(int(char, 16) for char in content.split('\\') if char.strip())
+    return codepoints
+
+
+def woff2_only(css, folder):
+    """Point every @font-face of ``css`` at a single woff2 source in ``folder``."""
+    def replace(match):
+        body = match.group(1)
+        font = FONT_FILE.search(body)
+        if font is None:
+            return match.group(0)
+        declarations = [d for d in body.split(';') if d.strip() and not d.strip().startswith('src:')]
+        declarations.append(f'src:url({folder}/{font.group(1)}.woff2) format("woff2")')
+        return '@font-face{' + ';'.join(declarations) + '}'
+
+    return FONT_FACE.sub(replace, css)
+
+
+class Assets:
+
+    def __init__(self, app=None):
+        self.files = {}
+        self.encodings = {}
+        self.immutable = set()
+        self.bundles = {}
+        self.purge = ()
+        self.exclude = ()
+        self.subsets = {}
+        self.enabled = False
+        self.static_folder = None
+        self.template_folders = ()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.template_folders = (os.path.join(app.root_path, app.template_folder),)
+        self.bundles = app.config.get('ASSETS_BUNDLES', {})
+        self.purge = app.config.get('ASSETS_PURGE', ())
+        self.exclude = app.config.get('ASSETS_EXCLUDE', ())
+        self.subsets = app.config.get('ASSETS_SUBSETS', {})
+        self.enabled = app.config.get('ASSETS_FINGERPRINT', True)
+        app.extensions['assets'] = self
+        app.add_template_global(self.bundle_urls, 'asset_urls')
+        if not self.enabled:
+            return
+        self.load()
+        app.url_defaults(self._url_defaults)
+        app.view_functions['static'] = self.send_static
+
+    @property
+    def build_folder(self):
+        return os.path.join(self.static_folder, BUILD_DIR)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.build_folder, MANIFEST)) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            manifest = {}
+        self.files = manifest.get('files', {})
+        self.encodings = manifest.get('encodings', {})
+        self.immutable = set(self.files.values())
+
+    def url(self, filename):
+        return self.files.get(filename, filename)
+
+    def bundle_urls(self, bundle, kind):
+        """URLs to include for a page type: the bundle once built, its members otherwise."""
+        filename = f'bundles/{bundle}.{kind}'
+        if self.enabled and filename in self.files:
+            filenames = [filename]
+        else:
+            filenames = self.bundles[bundle][kind]
+        return [url_for('static', filename=filename) for filename in filenames]
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.url(values['filename'])
+
+    def send_static(self, filename):
+        if filename not in self.immutable:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, extension in ENCODINGS:
+            if encoding in self.encodings.get(filename, ()) and request.accept_encodings[encoding]:
+                response = send_from_directory(
+                    self.static_folder, filename + extension, mimetype=mimetype)
+                response.content_encoding = encoding
+                break
+        else:
+            response = send_from_directory(self.static_folder, filename)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers.pop('Expires', None)
+        return response
+
+    def build(self, purge=False):
+        """Write the fingerprinted copies, the bundles and the manifest, return the manifest."""
+        shutil.rmtree(self.build_folder, ignore_errors=True)
+        sources = []
+        for root, dirs, files in os.walk(self.static_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.build_folder]
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), self.static_folder).replace(os.sep, '/')
+                if not any(fnmatch.fnmatch(path, pattern) for pattern in self.exclude):
+                    sources.append(path)
+
+        self.files, self.encodings = {}, {}
+        # Stylesheets last, their url() references point at already hashed files.
+        for filename in sorted(sources, key=lambda f: (f.endswith('.css'), f)):
+            with open(os.path.join(self.static_folder, filename), 'rb') as fp:
+                content = fp.read()
+            if filename.endswith('.css'):
+                content = self.rewrite_css(filename, content.decode('utf-8')).encode('utf-8')
+            self.emit(filename, content)
+
+        used = used_icons(*self.template_folders, self.static_folder) if purge else None
+        for bundle, kinds in self.bundles.items():
+            for kind, members in kinds.items():
+                self.emit(f'bundles/{bundle}.{kind}', self.concat(kind, members, used).encode('utf-8'))
+
+        self.write_manifest()
+        return self.files
+
+    def concat(self, kind, members, used=None):
+        chunks = []
+        for filename in members:
+            substitute = self.subsets.get(filename)
+            if substitute and os.path.exists(os.path.join(self.static_folder, substitute)):
+                filename = substitute
+            with open(os.path.join(self.static_folder, filename), encoding='utf-8') as fp:
+                chunks.append((filename, fp.read()))
+
+        if kind == 'js':
+            return '\n;\n'.join(minify_js(js).strip() for _, js in chunks) + '\n'
+
+        imports, rules = [], []
+        for filename, css in chunks:
+            css = CSS_CHARSET.sub('', self.rewrite_css(filename, css, base=f'{BUILD_DIR}/bundles'))
+            # @import is only valid before any other rule, hoist it out of the members.
+            imports.extend(CSS_IMPORT.findall(css))
+            css = CSS_IMPORT.sub('', css)
+            if used is not None and filename in self.purge:
+                css = purge_icons(css, used)
+            rules.append(minify_css(css))
+        return '@charset "UTF-8";' + ''.join(imports) + '\n'.join(rules)
+
+    def emit(self, filename, content):
+        """Write ``content`` under a hashed name for ``filename``, with compressed siblings."""
+        stem, extension = posixpath.splitext(filename)
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        target = f'{BUILD_DIR}/{stem}.{digest}{extension}'
+        path = os.path.join(self.static_folder, *target.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+
+        encodings = []
+        if extension in COMPRESSIBLE and len(content) >= MIN_COMPRESS_SIZE:
+            compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content, quality=11)
+            for encoding, suffix in ENCODINGS:
+                data = compressed.get(encoding)
+                if data is not None and len(data) < len(content):
+                    with open(path + suffix, 'wb') as fp:
+                        fp.write(data)
+                    encodings.append(encoding)
+
+        self.files[filename] = target
+        if encodings:
+            self.encodings[target] = encodings
+        return target
+
+    def rewrite_css(self, filename, css, base=None):
+        """
+        Point the relative url() references of ``css`` at their hashed copies,
+        relative to where the stylesheet is written (``base``, by default the
+        directory of its own hashed copy).
+        """
+        source_dir = posixpath.dirname(filename)
+        if base is None:
+            base = posixpath.join(BUILD_DIR, source_dir)
+
+        def replace(match):
+            quote, url = match.groups()
+            if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            path, sep, suffix = re.match(r'([^?#]*)([?#]?)(.*)', url).groups()
+            target = self.files.get(posixpath.normpath(posixpath.join(source_dir, path)))
+            if target is None:
+                return match.group(0)
+            return f'url({quote}{posixpath.relpath(target, base)}{sep}{suffix}{quote})'
+
+        return CSS_URL.sub(replace, css)
+
+    def subset_fonts(self, stylesheet='css/all.min.css', folder='webfonts'):
+        """
+        Write woff2 subsets of the fonts used by ``stylesheet`` holding only the
+        glyphs of the icons referenced by the templates, and the stylesheet
+        pointing at them (the ASSETS_SUBSETS substitute of ``stylesheet``).
+        """
+        if font_subset is None:
+            raise RuntimeError("fontTools is required to subset the webfonts.")
+
+        with open(os.path.join(self.static_folder, stylesheet), encoding='utf-8') as fp:
+            css = fp.read()
+        used = used_icons(*self.template_folders, self.static_folder)
+        codepoints = icon_codepoints(css, used)
+
+        output_folder = os.path.join(self.static_folder, folder, 'subset')
+        os.makedirs(output_folder, exist_ok=True)
+        written = {}
+        for name in sorted(set(FONT_FILE.findall(css))):
+            options = font_subset.Options()
+            options.flavor = 'woff2'
+            font = font_subset.load_font(os.path.join(self.static_folder, folder, f'{name}.woff2'), options)
+            subsetter = font_subset.Subsetter(options)
+            subsetter.populate(unicodes=codepoints)
+            subsetter.subset(font)
+            path = os.path.join(output_folder, f'{name}.woff2')
+            font_subset.save_font(font, path, options)
+            written[f'{folder}/subset/{name}.woff2'] = os.path.getsize(path)
+
+        target = self.subsets.get(stylesheet, stylesheet.replace('.min.css', '.subset.css'))
+        relative = posixpath.relpath(f'{folder}/subset', posixpath.dirname(target))
+        with open(os.path.join(self.static_folder, target), 'w', encoding='utf-8') as fp:
+            fp.write(woff2_only(purge_icons(css, used), relative))
+        return target, written
+
+    def write_manifest(self):
+        os.makedirs(self.build_folder, exist_ok=True)
+        with open(os.path.join(self.build_folder, MANIFEST), 'w') as fp:
+            json.dump(dict(files=self.files, encodings=self.encodings), fp, indent=2, sort_keys=True)
+        self.immutable = set(self.files.values())
+
+
+assets_cli = AppGroup('assets', help="Build the static assets.")
+
+
+@assets_cli.command('fonts')
+def fonts():
+    """Subset the Font Awesome webfonts to the icons used by the templates."""
+    assets = current_app.extensions['assets']
+    try:
+        stylesheet, written = assets.subset_fonts()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for filename, size in written.items():
+        click.echo(f"{filename}: {size} bytes")
+    click.echo(f"{stylesheet} written.")
+
+
+@assets_cli.command('build')
+@click.option('--purge', is_flag=True, help="Drop unused Font Awesome glyph rules from the bundles.")
+@click.option('--fonts', 'subset', is_flag=True, help="Subset the webfonts first.")
+@click.pass_context
+def build(ctx, purge, subset):
+    """Fingerprint, bundle and precompress the static folder."""
+    if subset:
+        ctx.invoke(fonts)
+    assets = current_app.extensions['assets']
+    files = assets.build(purge=purge)
+    click.echo(f"{len(files)} file(s) written to {assets.build_folder}.")
+    if brotli is None:
+        click.echo("brotli is not installed, only .gz files were produced.")
+    if rjsmin is None:
+        click.echo("rjsmin is not installed, the JS bundles were not minified.")
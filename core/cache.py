@@ -0,0 +1,224 @@
+"""
+Process-local caches for the public pages.
+"""
+
+import os
+import time
+import hashlib
+from threading import RLock
+
+from flask import current_app, make_response, render_template, request, session
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+CSRF_PLACEHOLDER = '\x00csrf-token\x00'
+
+
+class VersionStamp:
+    """Content version shared by every worker through the mtime of a file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = 0
+
+    @property
+    def value(self):
+        if self.path is None:
+            return self._local
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self):
+        self._local += 1
+        if self.path is None:
+            return
+        current = self.value
+        with open(self.path, 'a'):
+            pass
+        now = max(time.time_ns(), current + 1)
+        os.utime(self.path, ns=(now, now))
+
+
+class ShowcaseCache:
+    """TTL cache for the showcase lists, dropped whenever the content version moves."""
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stamp = VersionStamp()
+        self._models = ()
+        self._entries = {}
+        self._lock = RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SHOWCASE_CACHE_TTL', 300)
+        self.stamp = VersionStamp(app.config.get('CONTENT_VERSION_FILE'))
+        app.extensions['showcase_cache'] = self
+
+    @property
+    def version(self):
+        return self.stamp.value
+
+    def get(self, key, loader):
+        version = self.version
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[2]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            value = loader()
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            return value
+
+    def get_many(self, keys, loader):
+        """
+        Values of ``keys``; ``loader`` receives the keys missing from the
+        cache and returns a dict of their values, for one query per batch.
+        """
+        version = self.version
+        values, missing = {}, []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                values[key] = entry[2]
+            else:
+                missing.append(key)
+        self.hits += len(values)
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+                loaded = loader(missing)
+                expires = time.monotonic() + self.ttl
+                for key in missing:
+                    values[key] = loaded[key]
+                    self._entries[key] = (version, expires, loaded[key])
+        return values
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        self.stamp.bump()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            ratio=round(self.hits / lookups, 4) if lookups else 0.0,
+            invalidations=self.invalidations,
+            entries=len(self._entries),
+            version=self.version,
+        )
+
+    def watch(self, *models):
+        """Invalidate after any commit that wrote one of ``models``."""
+        self._models = tuple(models)
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def _after_flush(self, session, flush_context):
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, self._models):
+                session.info['showcase_dirty'] = True
+                return
+
+    def _after_commit(self, session):
+        if session.info.pop('showcase_dirty', False):
+            self.invalidate()
+
+    def _after_rollback(self, session):
+        session.info.pop('showcase_dirty', None)
+
+
+class PageCache:
+    """Rendered HTML cache keyed on template and content version.
+
+    The CSRF token is punched out of the cached body and filled back in per
+    session, so the page can be shared between visitors.
+    """
+
+    def __init__(self, showcase, app=None):
+        self.showcase = showcase
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}
+        self._lock = RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        app.extensions['page_cache'] = self
+
+    def can_serve(self):
+        return (
+            self.enabled and request.method in ('GET', 'HEAD')
+            and '_flashes' not in session
+        )
+
+    def render(self, template, **context):
+        if not self.can_serve():
+            return render_template(template, **context)
+
+        version = self.showcase.version
+        page = self._pages.get(template)
+        if page is not None and page[0] == version:
+            self.hits += 1
+        else:
+            with self._lock:
+                page = self._pages.get(template)
+                if page is None or page[0] != version:
+                    self.misses += 1
+                    page = self._render(template, version, context)
+                    self._pages[template] = page
+                else:
+                    self.hits += 1
+
+        _, body, digest = page
+        token = self._page_token() if CSRF_PLACEHOLDER in body else ''
+        response = make_response(body.replace(CSRF_PLACEHOLDER, token))
+        response.set_etag(hashlib.sha1(f'{digest}:{token}'.encode()).hexdigest())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, pages=len(self._pages))
+
+    def _render(self, template, version, context):
+        body = render_template(template, **context)
+        if current_app.config.get('WTF_CSRF_ENABLED', True):
+            body = body.replace(generate_csrf(), CSRF_PLACEHOLDER)
+        return version, body, hashlib.sha1(body.encode()).hexdigest()
+
+    def _page_token(self):
+        """Signed CSRF token reused for half its lifetime so the body, and its ETag, stay stable."""
+        limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        bucket = int(time.time() // (limit / 2)) if limit else 0
+        field = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+
+        cached = session.get('_page_csrf')
+        if cached and cached[:2] == [bucket, session.get(field)]:
+            return cached[2]
+        token = generate_csrf()
+        session['_page_csrf'] = [bucket, session[field], token]
+        return token
@@ -0,0 +1,197 @@
+"""
+Response compression middleware.
+
+Negotiates br/gzip from Accept-Encoding and compresses the body as the
+application yields it. Responses that are already encoded, too small or
+of a compressed media type (pictures, woff2, archives) pass through.
+Compressed bodies of cacheable responses are kept in a small LRU keyed
+on their ETag so they are only compressed once.
+"""
+
+import zlib
+from threading import Lock
+from collections import OrderedDict
+
+from werkzeug.datastructures import Headers, ResponseCacheControl
+from werkzeug.http import parse_accept_header, parse_cache_control_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/xhtml+xml', 'application/rss+xml', 'application/atom+xml',
+    'application/manifest+json', 'image/svg+xml', 'font/ttf', 'font/otf',
+    'application/vnd.ms-fontobject',
+)
+SKIPPED_STATUS = (204, 206, 304)
+MAX_CACHED_BODY = 1024 * 1024
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app, min_size=500, level=6, brotli_quality=4, cache_size=64):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def negotiate(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return written.append
+
+        iterable = self.app(environ, capture)
+        iterator = iter(iterable)
+        pending = []
+        # Applications may call start_response on their first iteration.
+        while 'status' not in captured:
+            try:
+                pending.append(next(iterator))
+            except StopIteration:
+                break
+
+        status = captured['status']
+        headers = Headers(captured['headers'])
+        if not self.should_compress(status, headers):
+            if status.startswith('304') and self.compressible(headers):
+                self.weaken_etag(headers)
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            if not written and not pending:
+                return iterable
+            return self._passthrough(iterable, written + pending, iterator)
+
+        streaming = 'Content-Length' not in headers
+
+        key = self.cache_key(environ, headers, encoding)
+        cached = self._get(key) if key else None
+
+        headers.remove('Content-Length')
+        headers['Content-Encoding'] = encoding
+        vary = headers.get('Vary')
+        headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+        self.weaken_etag(headers)
+
+        if cached is not None:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+            headers['Content-Length'] = str(len(cached))
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return [cached]
+
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        return self._compress(iterable, written + pending, iterator, encoding, key, streaming)
+
+    def should_compress(self, status, headers):
+        if int(status.split(None, 1)[0]) in SKIPPED_STATUS or not self.compressible(headers):
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    @staticmethod
+    def compressible(headers):
+        content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        return (
+            content_type.startswith(COMPRESSIBLE_TYPES)
+            and 'Content-Encoding' not in headers
+            and 'no-transform' not in headers.get('Cache-Control', '')
+        )
+
+    @staticmethod
+    def weaken_etag(headers):
+        # The encoded body is a different representation of the same entity.
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+    def cache_key(self, environ, headers, encoding):
+        etag = headers.get('ETag')
+        cache_control = parse_cache_control_header(headers.get('Cache-Control'), cls=ResponseCacheControl)
+        if (
+            not self.cache_size or not etag or environ.get('REQUEST_METHOD') != 'GET'
+            or cache_control.no_store or cache_control.private
+            or 'Content-Length' not in headers
+            or int(headers['Content-Length']) > MAX_CACHED_BODY
+        ):
+            return None
+        path = environ.get('PATH_INFO', '') + '?' + environ.get('QUERY_STRING', '')
+        return path, etag, encoding
+
+    def _get(self, key):
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+            return body
+
+    def _put(self, key, body):
+        with self._lock:
+            self._cache[key] = body
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.flush, compressor.finish
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return (
+            compressor.compress,
+            lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+    def _compress(self, iterable, head, iterator, encoding, key, streaming):
+        compress, flush, finish = self._compressor(encoding)
+        body = [] if key else None
+        try:
+            for chunks in (head, iterator):
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    data = compress(chunk)
+                    if streaming:
+                        # Streamed responses reach the client as they are produced.
+                        data += flush()
+                    if body is not None:
+                        body.append(data)
+                    yield data
+            data = finish()
+            if body is not None:
+                body.append(data)
+                self._put(key, b''.join(body))
+            yield data
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    @staticmethod
+    def _passthrough(iterable, head, iterator):
+        try:
+            yield from head
+            yield from iterator
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
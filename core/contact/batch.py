@@ -0,0 +1,131 @@
+"""
+Group commit of contact messages.
+
+With ``CONTACT_GROUP_COMMIT`` on, a request hands its message to an
+in-process buffer and waits. A writer thread inserts whatever arrived
+within ``CONTACT_GROUP_COMMIT_DELAY`` milliseconds, up to
+``CONTACT_GROUP_COMMIT_SIZE`` rows, in a single transaction, then releases
+the requests of that batch: a message is only acknowledged once it is
+committed, but a burst pays for one commit instead of one per message.
+"""
+
+import os
+import time
+import atexit
+import logging
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+from .. import db
+from .models import Contact
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContactBatcher:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._queue = []
+        self._pid = None
+        self._stopping = False
+        self._condition = Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['CONTACT_GROUP_COMMIT']
+        self.delay = app.config['CONTACT_GROUP_COMMIT_DELAY'] / 1000
+        self.batch_size = app.config['CONTACT_GROUP_COMMIT_SIZE']
+        self.timeout = app.config['CONTACT_GROUP_COMMIT_TIMEOUT']
+        app.extensions['contact_batcher'] = self
+
+    def save(self, **values):
+        """Store a contact message, returning once it is committed."""
+        if not self.enabled:
+            contact = Contact(**values)
+            db.session.add(contact)
+            db.session.commit()
+            return
+        self.start()
+        future = Future()
+        with self._condition:
+            self._queue.append((values, future))
+            self._condition.notify()
+        future.result(timeout=self.timeout)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not write the parent's pending messages twice.
+            self._queue = []
+            self._stopping = False
+            self._pid = os.getpid()
+            Thread(target=self._run, name='contact-writer', daemon=True).start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                with self.app.app_context():
+                    self.write(batch)
+            except Exception as e:
+                logger.exception("Contact batch failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _collect(self):
+        """Wait for a first message, then for the batch to fill or the delay to pass."""
+        with self._condition:
+            while not self._queue:
+                if self._stopping:
+                    return None
+                self._condition.wait()
+            deadline = time.monotonic() + self.delay
+            while len(self._queue) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.batch_size]
+            del self._queue[:self.batch_size]
+            return batch
+
+    def write(self, batch):
+        try:
+            try:
+                db.session.add_all([Contact(**values) for values, _ in batch])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                if len(batch) == 1:
+                    raise
+                # One bad row must not fail the whole batch: fall back to a commit each.
+                for values, future in batch:
+                    try:
+                        self.write([(values, future)])
+                    except Exception as e:
+                        future.set_exception(e)
+                return
+            for _, future in batch:
+                future.set_result(None)
+        finally:
+            db.session.remove()
+
+
+contact_batcher = ContactBatcher()
@@ -0,0 +1,63 @@
+"""
+Contact command line.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .. import db
+from .batch import contact_batcher
+from .digest import send_contact_digest
+from .models import Contact
+
+BENCHMARK_EMAIL = 'benchmark@example.invalid'
+
+
+contact = AppGroup('contact', help="Manage the contact messages.")
+
+
+@contact.command('digest')
+@click.option('--force', is_flag=True, help="Send even if the digest window has not elapsed.")
+def digest(force):
+    """Mail the new contact messages to the administrator in one email."""
+    count = send_contact_digest(force=force)
+    click.echo(f"{count} message(s) in the digest.")
+
+
+@contact.command('benchmark')
+@click.option('--messages', default=500, show_default=True, help="Messages stored per mode.")
+@click.option('--concurrency', default=16, show_default=True, help="Simultaneous submitters.")
+def benchmark(messages, concurrency):
+    """Compare a commit per message with group commit on the configured database."""
+    app = current_app._get_current_object()
+    enabled = contact_batcher.enabled
+
+    def submit(i):
+        with app.app_context():
+            started = time.perf_counter()
+            contact_batcher.save(
+                fullname='Benchmark', email=BENCHMARK_EMAIL, phone=0,
+                subject='benchmark', message=f'Message {i}'
+            )
+            return time.perf_counter() - started
+
+    try:
+        for label, mode in (("commit per message", False), ("group commit", True)):
+            contact_batcher.enabled = mode
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                latencies = sorted(executor.map(submit, range(messages)))
+            elapsed = time.perf_counter() - started
+            click.echo(
+                f"{label:>20}: {messages / elapsed:8.1f} msg/s"
+                f"  p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms"
+                f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms"
+            )
+    finally:
+        contact_batcher.enabled = enabled
+        Contact.query.filter_by(email=BENCHMARK_EMAIL).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,57 @@
+"""
+Periodic summary of the contact messages for the administrator.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app, render_template
+
+from .. import db
+from ..email import send_email
+from .forms import SUBJECT_CHOICE
+from .models import Contact, ContactDigest
+
+
+SUBJECTS = {str(value): label for value, label in SUBJECT_CHOICE}
+
+
+def contacts_between(since, until):
+    return Contact.query.filter(
+        Contact.timestamp > since, Contact.timestamp <= until
+    ).order_by(Contact.timestamp)
+
+
+def pending_contacts(since, until):
+    return contacts_between(since, until).all()
+
+
+def send_contact_digest(now=None, force=False):
+    """
+    Mail the messages received since the last digest as a single email.
+
+    Nothing is sent before ``CONTACT_DIGEST_WINDOW`` seconds have passed
+    since the previous digest, unless ``force`` is set. Returns the number
+    of messages summarised.
+    """
+    now = now or datetime.utcnow()
+    window = timedelta(seconds=current_app.config['CONTACT_DIGEST_WINDOW'])
+    since = ContactDigest.watermark() or now - window
+    if not force and now - since < window:
+        return 0
+
+    contacts = pending_contacts(since, now)
+    if not contacts:
+        return 0
+
+    context = dict(contacts=contacts, subjects=SUBJECTS, since=since, until=now)
+    db.session.add(ContactDigest(since=since, until=now, count=len(contacts)))
+    # send_email commits the digest row together with the outbox message.
+    site_name = current_app.config['SITE_NAME'] or 'Portfolio'
+    send_email(
+        f'[{site_name}] {len(contacts)} nouveau(x) message(s)',
+        sender=current_app.config['MAIL_SENDER'],
+        recipients=[current_app.config['FLASKY_ADMIN']],
+        text_body=render_template('admin/email/contact_digest.txt', **context),
+        html_body=render_template('admin/email/contact_digest.html', **context)
+    )
+    return len(contacts)
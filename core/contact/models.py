@@ -10,6 +10,7 @@ class Contact(Updateable, db.Model):
     """Contact model"""
 
     __tablename__ = 'contact'
+    __table_args__ = (db.Index('ix_contact_timestamp_id', 'timestamp', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text, nullable=False)
@@ -17,7 +18,26 @@ class Contact(Updateable, db.Model):
     email = db.Column(db.String(80), nullable=False)
     subject = db.Column(db.String(80), nullable=False)
     fullname = db.Column(db.String(80), nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow())
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 
     def __repr__(self):
         return f"Contact(id={self.id!r}, email={self.email!r}), phone={self.phone!r})"
+
+
+class ContactDigest(db.Model):
+    """Contact messages already summarised to the administrator"""
+
+    __tablename__ = 'contact_digest'
+
+    id = db.Column(db.Integer, primary_key=True)
+    since = db.Column(db.DateTime, nullable=False)
+    until = db.Column(db.DateTime, index=True, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ContactDigest(id={self.id!r}, until={self.until!r}, count={self.count!r})"
+
+    @staticmethod
+    def watermark():
+        return db.session.query(db.func.max(ContactDigest.until)).scalar()
@@ -1,22 +1,11 @@
-from threading import Thread
-
-from flask import current_app
-
-from . import mail
-from flask_mail import Message
-
-
-def send_async_email(app, message):
-    with app.app_context():
-        mail.send(message)
+from . import db
+from .outbox.models import OutboxMessage
+from .outbox.worker import mail_worker
 
 
 def send_email(subject, sender, recipients, text_body, html_body):
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    msg.html = html_body
-    thr = Thread(
-        target=send_async_email,
-        args=(current_app._get_current_object(), msg)
-    )
-    return thr.start()
+    """Store the message in the outbox; the mail worker delivers it."""
+    message = OutboxMessage.enqueue(subject, sender, recipients, text_body, html_body)
+    db.session.commit()
+    mail_worker.wake()
+    return message
@@ -0,0 +1,137 @@
+"""
+Query plan report for the hot query shapes.
+
+Each registered query is built by the same helper the application runs,
+passed through the database's EXPLAIN and flagged when the plan falls
+back to a full table scan, so a missing or unused index shows up before
+it shows up in the latency graphs.
+"""
+
+import re
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from . import db
+from .pagination import encode_cursor, keyset_query
+
+
+HOT_QUERIES = {}
+
+FULL_SCAN = {
+    'sqlite': re.compile(r'^SCAN (?!.*USING (COVERING )?INDEX)'),
+    'postgresql': re.compile(r'Seq Scan'),
+    'mysql': re.compile(r'\bALL\b'),
+}
+# Walking a whole index is only fine for shapes that read it in order under a LIMIT.
+INDEX_SCAN = {
+    'sqlite': re.compile(r'^SCAN '),
+}
+
+
+def hot_query(name, ordered_scan=False):
+    """
+    Register a function returning the query to explain under ``name``.
+    ``ordered_scan`` accepts a plan walking an index in order, for
+    ORDER BY ... LIMIT shapes.
+    """
+    def decorator(f):
+        HOT_QUERIES[name] = (f, ordered_scan)
+        return f
+    return decorator
+
+
+def explain(query):
+    """Plan lines of ``query`` for the bound database."""
+    statement = getattr(query, 'statement', query)
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = 'EXPLAIN QUERY PLAN' if dialect.name == 'sqlite' else 'EXPLAIN'
+    rows = connection.exec_driver_sql(f'{prefix} {compiled}', params).fetchall()
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [' | '.join(str(value) for value in row) for row in rows]
+
+
+def full_scans(dialect_name, plan, ordered_scan=False):
+    patterns = FULL_SCAN if ordered_scan else {**FULL_SCAN, **INDEX_SCAN}
+    pattern = patterns.get(dialect_name)
+    if pattern is None:
+        return []
+    return [line for line in plan if pattern.search(line)]
+
+
+@hot_query('login: user by email')
+def _user_by_email():
+    from .admin.models import User
+    return User.by_email('admin@example.com').limit(1)
+
+
+@hot_query('showcase: latest projects', ordered_scan=True)
+def _latest_projects():
+    from .admin.routes import _latest
+    from .main.models import Project
+    return _latest(Project, ('category', 'user'))
+
+
+@hot_query('admin: keyset page of contacts')
+def _contact_page():
+    from .contact.models import Contact
+    cursor = encode_cursor(datetime.utcnow(), 100)
+    return keyset_query(Contact.query, Contact, after=cursor,
+                        per_page=current_app.config['ADMIN_PER_PAGE'])
+
+
+@hot_query('admin: previous keyset page of contacts')
+def _contact_previous_page():
+    from .contact.models import Contact
+    cursor = encode_cursor(datetime.utcnow(), 100)
+    return keyset_query(Contact.query, Contact, before=cursor,
+                        per_page=current_app.config['ADMIN_PER_PAGE'])
+
+
+@hot_query('digest: contacts in a window')
+def _contact_window():
+    from .contact.digest import contacts_between
+    now = datetime.utcnow()
+    return contacts_between(now, now)
+
+
+@hot_query('outbox: due messages')
+def _due_messages():
+    from .outbox.models import OutboxMessage
+    return OutboxMessage.due(current_app.config['MAIL_OUTBOX_BATCH'])
+
+
+@hot_query('images: pending jobs')
+def _pending_jobs():
+    from .media.models import ImageJob
+    return ImageJob.claimable(current_app.config['IMAGE_WORKERS'])
+
+
+queries = AppGroup('queries', help="Inspect the hot query shapes.")
+
+
+@queries.command('explain')
+@click.option('--name', 'names', multiple=True, help="Only explain these queries.")
+def explain_command(names):
+    """Run EXPLAIN on each hot query and flag full table scans."""
+    dialect_name = db.session.connection().dialect.name
+    failures = 0
+    for name, (build, ordered_scan) in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        plan = explain(build())
+        scans = full_scans(dialect_name, plan, ordered_scan)
+        failures += bool(scans)
+        click.echo(f"{'FULL SCAN' if scans else 'ok':>9}  {name}")
+        for line in plan:
+            click.echo(f"{'':>11}{line}")
+    if failures:
+        raise click.ClickException(f"{failures} query(ies) scan a whole table.")
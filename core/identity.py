@@ -0,0 +1,150 @@
+"""
+Identity of the logged-in user kept in the session.
+
+The user loader stores the user id, role id, permission bitmask and email
+in the session, stamped with the identity version. While that version
+holds, requests are authenticated from the session alone and the ``users``
+row is only loaded when a view reads something else from it. Editing a
+role, or the role or email of a user, or deleting a user moves the version
+and every session reloads its row on the next request.
+"""
+
+from flask import session
+from flask_login import UserMixin, user_logged_out
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .cache import VersionStamp
+
+
+SESSION_KEY = '_identity'
+WATCHED_ATTRIBUTES = ('role', 'role_id', 'email')
+
+
+class UserProxy(UserMixin):
+    """Stand-in for a ``User`` row, loaded on first use of anything but the identity"""
+
+    def __init__(self, model, id, role_id, permissions, email, row=None):
+        self.__dict__.update(
+            _model=model, _row=row, id=id, role_id=role_id,
+            permissions=permissions, email=email
+        )
+
+    def __repr__(self):
+        return f"UserProxy(id={self.id!r}, loaded={self._row is not None!r})"
+
+    @property
+    def user(self):
+        """The ``User`` row, for the session and relationships."""
+        if self._row is None:
+            from . import db
+            self.__dict__['_row'] = db.session.get(self._model, self.id)
+        return self._row
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(self._model, name):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+        # The row is now the reference: drop the identity copy it would contradict.
+        for key in ('role_id', 'permissions', 'email'):
+            self.__dict__.pop(key, None)
+
+    def can(self, perm):
+        permissions = self.__dict__.get('permissions', Ellipsis)
+        if permissions is Ellipsis:
+            return self.user.can(perm)
+        return permissions is not None and permissions & perm == perm
+
+    def is_admin(self):
+        from .admin.models import Permission
+        return self.can(Permission.ADMIN)
+
+    def ping(self):
+        self._model.ping(self)
+
+    @property
+    def last_seen(self):
+        from . import presence
+        seen = presence.seen(self.id)
+        return seen if seen is not None else self.user.last_seen
+
+    def gravatar_hash(self):
+        return self._model.gravatar_hash(self)
+
+    def gravatar(self, *args, **kwargs):
+        return self._model.gravatar(self, *args, **kwargs)
+
+
+class IdentityCache:
+
+    def __init__(self, app=None):
+        self.stamp = VersionStamp()
+        self._user_model = None
+        self._role_model = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.stamp = VersionStamp(app.config.get('IDENTITY_VERSION_FILE'))
+        app.extensions['identity'] = self
+        user_logged_out.connect(self._logged_out, app)
+
+    @property
+    def version(self):
+        return self.stamp.value
+
+    def load(self, user_id):
+        """Proxy for ``user_id``, built from the session when its identity is current."""
+        cached = session.get(SESSION_KEY)
+        if cached is not None and cached[0] == user_id and cached[-1] == self.version:
+            return UserProxy(self._user_model, *cached[:-1])
+
+        from . import db
+        user = db.session.get(self._user_model, user_id)
+        if user is None:
+            session.pop(SESSION_KEY, None)
+            return None
+        permissions = user.role.permissions if user.role is not None else None
+        identity = [user.id, user.role_id, permissions, user.email]
+        session[SESSION_KEY] = identity + [self.version]
+        return UserProxy(self._user_model, *identity, row=user)
+
+    def invalidate(self):
+        self.stamp.bump()
+
+    def _logged_out(self, sender, user, **extra):
+        session.pop(SESSION_KEY, None)
+
+    def watch(self, user_model, role_model):
+        """Move the version after any commit that changes what identities hold."""
+        self._user_model = user_model
+        self._role_model = role_model
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def _after_flush(self, session, flush_context):
+        if any(self._changes_identity(instance, deleted=False) for instance in session.dirty) \
+                or any(self._changes_identity(instance, deleted=True) for instance in session.deleted):
+            session.info['identity_dirty'] = True
+
+    def _changes_identity(self, instance, deleted):
+        if isinstance(instance, self._role_model):
+            return True
+        if not isinstance(instance, self._user_model):
+            return False
+        if deleted:
+            return True
+        attrs = inspect(instance).attrs
+        return any(attrs[name].history.has_changes() for name in WATCHED_ATTRIBUTES)
+
+    def _after_commit(self, session):
+        if session.info.pop('identity_dirty', False):
+            self.invalidate()
+
+    def _after_rollback(self, session):
+        session.info.pop('identity_dirty', None)
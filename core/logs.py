@@ -0,0 +1,119 @@
+"""
+Logging pipeline.
+
+Request threads only push records on a queue; a listener thread does the
+file and SMTP I/O. Error mails are de-duplicated by fingerprint and rate
+limited so an error burst sends a handful of mails, not one per request.
+"""
+
+import os
+import copy
+import time
+import atexit
+import hashlib
+import logging
+import traceback
+from queue import SimpleQueue
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, SMTPHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+
+def fingerprint(record):
+    """Identify a record by its exception type and stack, or by its call site."""
+    if record.exc_info and record.exc_info[0] is not None:
+        exc_type, _, tb = record.exc_info
+        frames = ''.join(
+            f'{frame.filename}:{frame.name}:{frame.lineno};'
+            for frame in traceback.extract_tb(tb)
+        )
+        source = f'{exc_type.__module__}.{exc_type.__qualname__}|{frames}'
+    else:
+        source = f'{record.pathname}:{record.lineno}'
+    return hashlib.sha1(source.encode()).hexdigest()[:16]
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the request details onto the record before it leaves the request thread."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.url = request.url
+            record.method = request.method
+            record.ip = request.remote_addr
+            # Only report a user already loaded, logging must not query the database.
+            user = g.get('_login_user')
+            record.user_id = getattr(user, 'id', None)
+        else:
+            record.url = record.method = record.ip = record.user_id = '-'
+        record.fingerprint = fingerprint(record)
+        return True
+
+
+class ThrottledSMTPHandler(SMTPHandler):
+    """SMTPHandler sending each fingerprint once per window, and at most ``limit`` mails per ``period``."""
+
+    def __init__(self, *args, limit=10, period=3600, window=600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limit = limit
+        self.period = period
+        self.window = window
+        self.dropped = 0
+        self._sent = deque()
+        self._seen = {}
+
+    def emit(self, record):
+        now = time.monotonic()
+        key = getattr(record, 'fingerprint', None) or fingerprint(record)
+        last, suppressed = self._seen.get(key, (None, 0))
+        if last is not None and now - last < self.window:
+            self._seen[key] = (last, suppressed + 1)
+            return
+
+        while self._sent and now - self._sent[0] >= self.period:
+            self._sent.popleft()
+        if len(self._sent) >= self.limit:
+            self.dropped += 1
+            return
+
+        self._sent.append(now)
+        self._seen[key] = (now, 0)
+        if len(self._seen) > 1024:
+            self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+        if suppressed:
+            record = copy.copy(record)
+            record.msg = f'{record.getMessage()}\n\n({suppressed} similar record(s) suppressed)'
+            record.args = None
+        super().emit(record)
+
+
+def setup_logging(app):
+    """Move the handlers of ``app.logger`` behind a queue served by a listener thread."""
+    handlers = [handler for handler in app.logger.handlers if handler is not default_handler]
+    if not handlers:
+        return None
+    for handler in handlers:
+        app.logger.removeHandler(handler)
+
+    queue_handler = QueueHandler(SimpleQueue())
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    app.logger.addHandler(queue_handler)
+    listener.start()
+
+    def stop():
+        if listener._thread is not None:
+            listener.stop()
+
+    def restart():
+        # The listener thread does not survive a fork (gunicorn --preload).
+        listener._thread = None
+        listener.queue = queue_handler.queue = SimpleQueue()
+        listener.start()
+
+    atexit.register(stop)
+    os.register_at_fork(after_in_child=restart)
+    app.extensions['log_listener'] = listener
+    return listener
@@ -74,12 +74,17 @@ class Project(Updateable, db.Model):
     """Project model"""
 
     __tablename__ = 'project'
+    __table_args__ = (
+        db.Index('ix_project_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_project_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_project_category_id_timestamp', 'category_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     image = db.Column(db.String(80), nullable=False)
     timestamp = db.Column(
         db.DateTime,
-        index=True, default=datetime.utcnow()
+        index=True, default=datetime.utcnow
     )
     category_id = db.Column(
         db.Integer,
@@ -98,12 +103,16 @@ class Storie(Updateable, db.Model):
     """Storie model"""
 
     __tablename__ = 'storie'
+    __table_args__ = (
+        db.Index('ix_storie_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_storie_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     fullname = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(80), nullable=False)
     content = db.Column(db.Text)
     image = db.Column(db.String(80), nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow())
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id'), nullable=False
@@ -117,10 +126,14 @@ class Client(Updateable, db.Model):
     """Client model"""
 
     __tablename__ = 'partner'
+    __table_args__ = (
+        db.Index('ix_partner_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_partner_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     image = db.Column(db.String(80), nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow())
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id'), nullable=False
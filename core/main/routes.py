@@ -3,39 +3,39 @@ Main page routes.
 """
 
 import os
-from urllib.parse import urlparse
 
 from flask import(
     render_template, url_for, abort, flash, redirect,
-    request, current_app, make_response, send_from_directory, Response
+    request, current_app, send_from_directory, Response
 )
 
 
-from .. import db
+from .. import page_cache
 from . import main
 from .models import Project
+from .sitemap import sitemap_pages, page_lastmod, sitemap_response
 
 from ..email import send_email
-from ..contact.models import Contact
 from ..contact.forms import ContactForm
+from ..contact.batch import contact_batcher
+from ..ratelimit import rate_limited
 
 
 @main.route("/", methods=['GET', 'POST'], strict_slashes=False)
+@rate_limited('contact')
 def homePage():
     page_title = 'Hello, je suis Flavien HUGS'
 
     form = ContactForm()
     if form.validate_on_submit():
         try:
-            contact = Contact(
+            contact_batcher.save(
                 fullname=form.fullname.data,
                 email=form.email.data.lower(),
                 phone=form.phone.data,
                 subject=form.subject.data,
                 message=form.message.data
             )
-            db.session.add(contact)
-            db.session.commit()
             msg = f"""
                 Hey {form.fullname.data},
                 votre message a été envoyé avec success.
@@ -46,7 +46,7 @@ def homePage():
         except Exception as e:
             abort(400)
 
-    return render_template(
+    return page_cache.render(
         'index.html',
         form=form,
         page_title=page_title
@@ -74,40 +74,33 @@ def servicePage():
 @main.route("/sitemap/", strict_slashes=False)
 @main.route("/sitemap.xml/", strict_slashes=False)
 def sitemap():
+    pages = sitemap_pages()
+    if len(pages) == 1:
+        return sitemap_response('sitemap.xml', urls=pages[0])
+
+    sitemaps = [
+        dict(loc=f"/sitemap-{n}.xml", lastmod=page_lastmod(urls))
+        for n, urls in enumerate(pages, start=1)
+    ]
+    return sitemap_response('sitemap_index.xml', sitemaps=sitemaps)
 
-    host_components = urlparse(request.host_url)
-    host_base = host_components.scheme + "://" + host_components.netloc
-
-    static_urls = list()
-    for rule in current_app.url_map.iter_rules():
-        if(
-            not str(rule).startswith("/21fh08/"),
-            not str(rule).startswith("/errors/")
-        ):
-            if "GET" in rule.methods and len(rule.arguments) == 0:
-                url = {
-                    "loc": f"{host_base}{str(rule)}",
-                    "changefreq": "weekly",
-                    "priority": "0.9"
-                }
-                static_urls.append(url)
-
-    xml_sitemap = render_template(
-        "sitemap.xml",
-        static_urls=static_urls,
-        host_base=host_base
-    )
-    response = make_response(xml_sitemap)
-    response.headers["Content-Type"] = "application/xml"
 
-    return response
+@main.route("/sitemap-<int:page>.xml/", strict_slashes=False)
+def sitemapPage(page):
+    pages = sitemap_pages()
+    if not 1 <= page <= len(pages):
+        abort(404)
+    return sitemap_response('sitemap.xml', urls=pages[page - 1])
 
 
 @main.route('/robots.txt/', strict_slashes=False)
 def noindex():
     Disallow = lambda string: f'Disallow: {string}'
+    sitemap_url = url_for('main.sitemap', _external=True).rstrip('/')
     r = Response(
-        "User-Agent: *\n{0}\n".format("\n".join([Disallow('/21fh08/')])),
+        "User-Agent: *\n{0}\n\nSitemap: {1}\n".format(
+            "\n".join([Disallow('/21fh08/')]), sitemap_url
+        ),
             status=200, mimetype="text/plain"
         )
     r.headers["Content-Type"] = "text/plain; charset=utf-8"
@@ -0,0 +1,86 @@
+"""
+Sitemap built once per content version and streamed to crawlers.
+"""
+
+import hashlib
+from collections import namedtuple
+
+from flask import current_app, request, Response
+from sqlalchemy import func
+
+from .. import db, cache
+from .models import Project, Storie, Client
+
+
+SitemapUrl = namedtuple('SitemapUrl', 'loc lastmod changefreq priority')
+
+EXCLUDED_PREFIXES = ('/21fh08/', '/errors/', '/static/')
+EXCLUDED_ENDPOINTS = ('main.sitemap', 'main.sitemapPage', 'main.noindex', 'main.favicon', 'metrics')
+# Template events per streamed chunk.
+STREAM_BUFFER = 1000
+
+
+def content_lastmod():
+    """Timestamp of the newest showcase entry, shown on the home page."""
+    stamps = [
+        db.session.query(func.max(model.timestamp)).scalar()
+        for model in (Project, Storie, Client)
+    ]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def site_url():
+    """Scheme and host of the sitemap URLs: the canonical ``SERVER_NAME`` when configured."""
+    server_name = current_app.config.get('SERVER_NAME')
+    if server_name:
+        return f"{current_app.config['PREFERRED_URL_SCHEME']}://{server_name}"
+    return request.host_url.rstrip('/')
+
+
+def build_urls():
+    """Paths of the public pages, prefixed with ``site_url()`` when rendered."""
+    lastmod = content_lastmod()
+    urls = []
+    for rule in current_app.url_map.iter_rules():
+        path = str(rule)
+        if (
+            path.startswith(EXCLUDED_PREFIXES) or rule.endpoint in EXCLUDED_ENDPOINTS
+            or 'GET' not in rule.methods or rule.arguments
+        ):
+            continue
+        if path == '/':
+            urls.append(SitemapUrl(path, lastmod, 'daily', '1.0'))
+        else:
+            urls.append(SitemapUrl(path, None, 'weekly', '0.9'))
+    urls.sort(key=lambda url: url.loc)
+    return urls
+
+
+def sitemap_pages():
+    """URL chunks of at most ``SITEMAP_MAX_URLS``, cached until the content changes."""
+    def load():
+        urls = build_urls()
+        size = current_app.config.get('SITEMAP_MAX_URLS', 50000)
+        return [urls[i:i + size] for i in range(0, len(urls), size)] or [[]]
+    return cache.get('sitemap', load)
+
+
+def page_lastmod(urls):
+    stamps = [url.lastmod for url in urls if url.lastmod is not None]
+    return max(stamps) if stamps else None
+
+
+def sitemap_response(template, **context):
+    """Stream ``template`` with an ETag bound to the content version."""
+    base = site_url()
+    etag = hashlib.sha1(f'{cache.version}:{base}:{request.path}'.encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        stream = current_app.jinja_env.get_template(template).stream(site_url=base, **context)
+        stream.enable_buffering(STREAM_BUFFER)
+        response = Response(stream, mimetype='application/xml')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
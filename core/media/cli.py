@@ -0,0 +1,61 @@
+"""
+Media command line.
+"""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .. import db
+from .models import ImageJob
+from .store import collect_garbage
+from .worker import image_worker
+
+
+images = AppGroup('images', help="Manage uploaded picture derivatives.")
+
+
+@images.command('drain')
+def drain():
+    """Process every pending image job and wait for completion."""
+    finished = image_worker.drain()
+    click.echo(f"{finished} job(s) processed.")
+
+
+@images.command('reprocess')
+@click.option('--failed', 'scope', flag_value='failed', default=True, help="Retry failed jobs (default).")
+@click.option('--all', 'scope', flag_value='all', help="Regenerate the derivatives of every upload.")
+@click.option('--no-drain', is_flag=True, help="Only enqueue, let the web workers pick the jobs up.")
+def reprocess(scope, no_drain):
+    """Queue jobs again, then drain the queue."""
+    if scope == 'all':
+        from ..main.models import Project, Storie, Client
+        sources = set()
+        for model in (Project, Storie, Client):
+            sources.update(image for (image,) in db.session.query(model.image))
+        for source in sources:
+            ImageJob.enqueue(source)
+        count = len(sources)
+    else:
+        count = ImageJob.query.filter_by(status=ImageJob.FAILED).update(
+            {'status': ImageJob.PENDING, 'attempts': 0}, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"{count} job(s) queued.")
+
+    if not no_drain:
+        drain.callback()
+
+
+@images.command('gc')
+@click.option('--grace', default=3600, show_default=True, help="Keep files younger than this many seconds.")
+@click.option('--dry-run', is_flag=True, help="Only list the files that would be removed.")
+def gc(grace, dry_run):
+    """Remove uploads and derivatives no longer referenced."""
+    from ..main.models import Project, Storie, Client
+    removed = collect_garbage(
+        current_app.config['UPLOAD_FOLDER_PATH'],
+        (Project, Storie, Client), grace=grace, dry_run=dry_run
+    )
+    for filename in removed:
+        click.echo(filename)
+    click.echo(f"{len(removed)} file(s) {'would be ' if dry_run else ''}removed.")
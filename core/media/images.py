@@ -0,0 +1,73 @@
+"""
+Derivatives generated from uploaded pictures.
+"""
+
+import os
+
+from PIL import Image, ImageOps
+
+try:
+    import pillow_avif  # noqa: F401 registers the AVIF plugin
+except ImportError:
+    pillow_avif = None
+
+
+VARIANTS = {'thumb': 320, 'card': 640, 'full': 1280}
+
+FORMATS = {
+    'webp': ('WEBP', dict(quality=80, method=4)),
+    'jpeg': ('JPEG', dict(quality=82, optimize=True, progressive=True)),
+}
+if pillow_avif is not None:
+    FORMATS['avif'] = ('AVIF', dict(quality=60))
+
+
+def variant_filename(source, name, extension):
+    stem, _ = os.path.splitext(source)
+    return f"{stem}-{name}.{extension}"
+
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(folder, source, variants=VARIANTS, formats=FORMATS):
+    """
+    Write the width-bucketed derivatives of ``source`` next to it and return
+    their description. Pictures are never upscaled and EXIF data is dropped.
+    """
+    created = []
+    with Image.open(os.path.join(folder, source)) as original:
+        image = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get('icc_profile')
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for name, width in sorted(variants.items(), key=lambda item: item[1]):
+            if width >= image.width:
+                width = image.width
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            resized.info = {}
+
+            for extension, (fmt, options) in formats.items():
+                frame = _flatten(resized) if fmt == 'JPEG' else resized
+                filename = variant_filename(source, name, extension)
+                path = os.path.join(folder, filename)
+                if icc_profile:
+                    frame.save(path, fmt, icc_profile=icc_profile, **options)
+                else:
+                    frame.save(path, fmt, **options)
+                created.append(dict(
+                    name=name, format=extension, width=width, height=height,
+                    filename=filename, size=os.path.getsize(path)
+                ))
+
+            if width == image.width:
+                break
+    return created
@@ -0,0 +1,141 @@
+""" Media app models """
+
+from datetime import datetime
+
+from flask import url_for
+
+from .. import db, cache
+
+
+class Blob(db.Model):
+    """Uploaded file stored under the hash of its content"""
+
+    __tablename__ = 'blob'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(80), unique=True, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"Blob(filename={self.filename!r}, refcount={self.refcount!r})"
+
+
+class ImageVariant(db.Model):
+    """Derivative of an uploaded picture"""
+
+    __tablename__ = 'image_variant'
+    __table_args__ = (db.UniqueConstraint('source', 'name', 'format'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(80), index=True, nullable=False)
+    name = db.Column(db.String(16), nullable=False)
+    format = db.Column(db.String(8), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(120), unique=True, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ImageVariant(id={self.id!r}, filename={self.filename!r})"
+
+    @staticmethod
+    def record(source, variants):
+        ImageVariant.query.filter_by(source=source).delete()
+        for variant in variants:
+            db.session.add(ImageVariant(source=source, **variant))
+
+
+class ImageJob(db.Model):
+    """Pending derivative generation for an uploaded picture"""
+
+    __tablename__ = 'image_job'
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(80), index=True, nullable=False)
+    status = db.Column(db.String(10), index=True, nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ImageJob(id={self.id!r}, source={self.source!r}, status={self.status!r})"
+
+    @staticmethod
+    def enqueue(source):
+        job = ImageJob.query.filter_by(source=source, status=ImageJob.PENDING).first()
+        if job is None:
+            job = ImageJob(source=source, status=ImageJob.PENDING)
+            db.session.add(job)
+        return job
+
+    @staticmethod
+    def needed(source):
+        """Whether ``source`` has neither derivatives nor a job on the way."""
+        if ImageVariant.query.filter_by(source=source).first() is not None:
+            return False
+        return ImageJob.query.filter(
+            ImageJob.source == source,
+            ImageJob.status.in_((ImageJob.PENDING, ImageJob.RUNNING))
+        ).first() is None
+
+    @staticmethod
+    def claimable(limit):
+        """Id and source of the jobs waiting for a worker, oldest first."""
+        return db.session.query(ImageJob.id, ImageJob.source).filter_by(
+            status=ImageJob.PENDING).order_by(ImageJob.id).limit(limit)
+
+
+class Variants:
+    """Lookup of the derivatives of one picture, as used by the templates"""
+
+    def __init__(self, source, rows=()):
+        self.source = source
+        self.rows = sorted(rows, key=lambda row: row[2])
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def formats(self):
+        return sorted({fmt for _, fmt, _ in self.rows}, key=('avif', 'webp', 'jpeg').index)
+
+    def srcset(self, fmt):
+        return ', '.join(
+            f"{url_for('admin.upload', filename=filename)} {width}w"
+            for filename, row_fmt, width in self.rows if row_fmt == fmt
+        )
+
+    def src(self, name='card', fmt='jpeg'):
+        candidates = [filename for filename, row_fmt, _ in self.rows if row_fmt == fmt]
+        for filename in candidates:
+            if filename.endswith(f'-{name}.{fmt}'):
+                break
+        else:
+            filename = candidates[-1] if candidates else self.source
+        return url_for('admin.upload', filename=filename)
+
+
+def image_variants(source):
+    return image_variants_for([source])[source]
+
+
+def image_variants_for(sources):
+    """Variants of every picture in ``sources``, read with one query."""
+    sources = list(dict.fromkeys(source for source in sources if source))
+
+    def load(keys):
+        rows = {key: [] for key in keys}
+        query = ImageVariant.query.filter(ImageVariant.source.in_([key[1] for key in keys]))
+        for row in query:
+            rows[('variants', row.source)].append((row.filename, row.format, row.width))
+        return rows
+
+    cached = cache.get_many([('variants', source) for source in sources], load)
+    return {source: Variants(source, cached[('variants', source)]) for source in sources}
@@ -0,0 +1,149 @@
+"""
+Content-addressed storage for uploaded files.
+
+Uploads are named after the SHA-256 of their content, so the same picture
+sent twice is stored once and its URL never changes meaning. The ``blob``
+table counts how many Project, Storie and Client rows point at each file.
+"""
+
+import os
+import re
+import time
+import hashlib
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from .. import db
+from .models import Blob, ImageJob, ImageVariant
+
+
+CHUNK_SIZE = 64 * 1024
+TEMP_PREFIX = '.upload-'
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}(-[a-z]+)?\.[a-z0-9]+$')
+
+
+def is_content_addressed(filename):
+    return HASHED_NAME.match(filename) is not None
+
+
+def store_stream(stream, extension, folder):
+    """
+    Copy ``stream`` into ``folder`` while hashing it, without holding the
+    whole file in memory. Returns the hashed filename and whether it is new.
+    """
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                output.write(chunk)
+        filename = digest.hexdigest() + extension.lower()
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            try:
+                # Restart the garbage collector's grace period for the new reference.
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                os.remove(temp_path)
+                return filename, False
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+        return filename, True
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _adjust(connection, filename, delta):
+    if not filename:
+        return
+    table = Blob.__table__
+    result = connection.execute(
+        table.update()
+        .where(table.c.filename == filename)
+        .values(refcount=table.c.refcount + delta)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(
+            filename=filename, refcount=max(delta, 0), created_at=datetime.utcnow()
+        ))
+
+
+def _after_insert(mapper, connection, target):
+    _adjust(connection, target.image, 1)
+
+
+def _after_delete(mapper, connection, target):
+    _adjust(connection, target.image, -1)
+
+
+def _after_update(mapper, connection, target):
+    history = inspect(target).attrs.image.history
+    if history.has_changes():
+        for old in history.deleted:
+            _adjust(connection, old, -1)
+        for new in history.added:
+            _adjust(connection, new, 1)
+
+
+def track_references(*models):
+    """Keep ``blob.refcount`` in step with the ``image`` column of ``models``."""
+    for model in models:
+        if not event.contains(model, 'after_insert', _after_insert):
+            event.listen(model, 'after_insert', _after_insert)
+            event.listen(model, 'after_update', _after_update)
+            event.listen(model, 'after_delete', _after_delete)
+
+
+def referenced_files(*models):
+    counts = {}
+    for model in models:
+        for (image,) in db.session.query(model.image):
+            counts[image] = counts.get(image, 0) + 1
+    return counts
+
+
+def collect_garbage(folder, models, grace=3600, dry_run=False):
+    """
+    Recount references from the models, then remove the uploads, derivatives
+    and interrupted temporary files nobody points at. Files younger than
+    ``grace`` seconds are kept, their row may not be committed yet.
+    """
+    counts = referenced_files(*models)
+    for blob in Blob.query:
+        blob.refcount = counts.pop(blob.filename, 0)
+    for filename, refcount in counts.items():
+        db.session.add(Blob(filename=filename, refcount=refcount))
+
+    live = {blob.filename for blob in Blob.query.filter(Blob.refcount > 0)}
+    variants = dict(db.session.query(ImageVariant.filename, ImageVariant.source))
+    keep = live | {name for name, source in variants.items() if source in live}
+
+    removed = []
+    deadline = time.time() - grace
+    for entry in os.scandir(folder):
+        if not entry.is_file() or entry.name in keep:
+            continue
+        if entry.stat().st_mtime > deadline:
+            continue
+        removed.append(entry.name)
+        if not dry_run:
+            os.remove(entry.path)
+
+    if dry_run:
+        db.session.rollback()
+        return removed
+
+    dead = [blob.filename for blob in Blob.query.filter(Blob.refcount <= 0)]
+    if dead:
+        ImageVariant.query.filter(ImageVariant.source.in_(dead)).delete(synchronize_session=False)
+        ImageJob.query.filter(ImageJob.source.in_(dead)).delete(synchronize_session=False)
+        Blob.query.filter(Blob.filename.in_(dead)).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,180 @@
+"""
+Background generation of picture derivatives.
+
+Jobs live in the ``image_job`` table so they survive restarts; every web
+process runs one dispatcher thread that claims pending jobs and feeds them
+to a bounded process pool, since the Pillow work is CPU bound.
+"""
+
+import os
+import atexit
+import logging
+import multiprocessing
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .. import db
+from .images import render_variants
+from .models import ImageJob, ImageVariant
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageWorker:
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._thread = None
+        self._pid = None
+        self._running = {}
+        self._wake = Event()
+        self._stopping = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config['IMAGE_WORKERS']
+        self.poll_interval = app.config['IMAGE_WORKER_POLL']
+        self.max_attempts = app.config['IMAGE_JOB_MAX_ATTEMPTS']
+        self.job_timeout = app.config['IMAGE_JOB_TIMEOUT']
+        app.extensions['image_worker'] = self
+        if app.config['IMAGE_WORKER_ENABLED']:
+            # Started lazily so the thread and the pool live in the forked gunicorn worker.
+            app.before_request(self.start)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that already ran the dispatcher: its
+                # pool and running jobs belong to the parent.
+                self._pool = None
+                self._running = {}
+                self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='image-worker', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._pool is not None:
+            # shutdown(cancel_futures=True) needs Python 3.9.
+            for future in list(self._running):
+                future.cancel()
+            self._pool.shutdown(wait=False)
+
+    def wake(self):
+        self._wake.set()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # Forking from this multithreaded process could copy locks held
+            # by other threads into the children: start them fresh instead.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self):
+        with self.app.app_context():
+            self.recover()
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.step(self.poll_interval)
+            except Exception:
+                logger.exception("Image worker iteration failed")
+            if not self._running:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def recover(self):
+        """Put back jobs left running by a process that died."""
+        deadline = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        ImageJob.query.filter(
+            ImageJob.status == ImageJob.RUNNING,
+            ImageJob.updated_at < deadline
+        ).update({'status': ImageJob.PENDING}, synchronize_session=False)
+        db.session.commit()
+
+    def step(self, timeout):
+        """Claim what the pool has room for, then collect finished jobs."""
+        claimed = self.claim(self.max_workers - len(self._running))
+        for job_id, source in claimed:
+            try:
+                future = self.pool.submit(
+                    render_variants, self.app.config['UPLOAD_FOLDER_PATH'],
+                    source, self.app.config['IMAGE_VARIANTS']
+                )
+            except BrokenProcessPool:
+                self._pool = None
+                ImageJob.query.filter_by(id=job_id).update(
+                    {'status': ImageJob.PENDING}, synchronize_session=False)
+                db.session.commit()
+                continue
+            self._running[future] = job_id
+
+        done = ()
+        if self._running:
+            done, _ = wait(list(self._running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                self.finish(self._running.pop(future), future)
+        db.session.remove()
+        return len(claimed), len(done)
+
+    def claim(self, limit):
+        if limit <= 0:
+            return []
+        candidates = ImageJob.claimable(limit).all()
+        claimed = []
+        for job_id, source in candidates:
+            updated = ImageJob.query.filter_by(id=job_id, status=ImageJob.PENDING).update({
+                'status': ImageJob.RUNNING,
+                'attempts': ImageJob.attempts + 1,
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+            if updated:
+                claimed.append((job_id, source))
+        db.session.commit()
+        return claimed
+
+    def finish(self, job_id, future):
+        job = ImageJob.query.get(job_id)
+        if job is None:
+            logger.info("Image job %s was deleted while it ran", job_id)
+            return
+        try:
+            ImageVariant.record(job.source, future.result())
+            job.status = ImageJob.DONE
+            job.error = None
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            logger.warning("Image job %s failed: %s", job_id, e)
+            job.error = repr(e)
+            job.status = ImageJob.FAILED if job.attempts >= self.max_attempts else ImageJob.PENDING
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+
+    def drain(self):
+        """Process every pending job from the current process and wait for them."""
+        finished = 0
+        while True:
+            claimed, done = self.step(timeout=None)
+            finished += done
+            if not claimed and not self._running:
+                return finished
+
+
+image_worker = ImageWorker()
@@ -0,0 +1,306 @@
+"""
+Prometheus metrics shared by the gunicorn workers.
+
+Each process keeps its series in memory and a flusher thread writes them
+to ``METRICS_DIR/<pid>.json``. A scrape of ``/metrics`` sums the files of
+every worker: counters of dead processes are folded into ``archive.json``
+so totals never go backwards, gauges only count live processes.
+
+The endpoint answers a bearer ``METRICS_TOKEN``, an admin session, or the
+addresses in ``METRICS_ALLOWED_IPS``, which are only meaningful behind a
+proxy once ``TRUSTED_PROXIES`` is set.
+"""
+
+import os
+import hmac
+import json
+import time
+import fcntl
+import atexit
+import tempfile
+import logging
+from threading import Event, Lock, Thread
+from collections import defaultdict
+
+from flask import Response, abort, g, request
+from flask_login import current_user
+
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = {
+    'http_requests_total': ('counter', "Requests handled, by endpoint, method and status."),
+    'http_request_duration_seconds': ('histogram', "Request latency, by endpoint."),
+    'http_requests_in_flight': ('gauge', "Requests being handled."),
+    'db_pool_size': ('gauge', "Connections the pool keeps open."),
+    'db_pool_checked_out': ('gauge', "Connections in use."),
+    'db_pool_overflow': ('gauge', "Connections opened above the pool size."),
+    'showcase_cache_hits_total': ('counter', "Showcase cache lookups served from memory."),
+    'showcase_cache_misses_total': ('counter', "Showcase cache lookups that hit the database."),
+    'showcase_cache_hit_ratio': ('gauge', "Showcase cache hits over lookups."),
+    'page_cache_hits_total': ('counter', "Pages served from the page cache."),
+    'page_cache_misses_total': ('counter', "Pages rendered for the page cache."),
+    'page_cache_hit_ratio': ('gauge', "Page cache hits over lookups."),
+    'mail_outbox_messages': ('gauge', "Outbox messages, by status."),
+    'image_jobs': ('gauge', "Image derivative jobs, by status."),
+}
+
+
+def series(name, **labels):
+    if not labels:
+        return name
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels.items()
+    )
+    return f'{name}{{{pairs}}}'
+
+
+def family(key):
+    name = key.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and FAMILIES.get(base, ('',))[0] == 'histogram':
+            return base
+    return name
+
+
+def sort_key(item):
+    """Order the series of a family, histogram buckets by their bound."""
+    key = item[0]
+    if ',le="' in key or '{le="' in key:
+        key, _, bound = key.rpartition('le="')
+        return key, float(bound.rstrip('"}'))
+    return key, 0.0
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.counters = defaultdict(float)
+        self.in_flight = 0
+        self._thread = None
+        self._stopping = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['METRICS_ENABLED']
+        self.directory = app.config['METRICS_DIR']
+        self.allowed_ips = set(app.config['METRICS_ALLOWED_IPS'])
+        self.token = app.config['METRICS_TOKEN']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    # Recording
+
+    def before_request(self):
+        self.start()
+        g._metrics_start = time.perf_counter()
+        g._metrics_recorded = False
+        g._metrics_in_flight = True
+        with self._lock:
+            self.in_flight += 1
+
+    def after_request(self, response):
+        self.observe(response.status_code)
+        return response
+
+    def teardown_request(self, exc):
+        if not g.get('_metrics_recorded', True):
+            # An unhandled exception skipped after_request.
+            self.observe(500)
+        if g.pop('_metrics_in_flight', False):
+            # Not counted when an earlier before_request answered or raised.
+            with self._lock:
+                self.in_flight -= 1
+
+    def observe(self, status):
+        started = g.pop('_metrics_start', None)
+        if started is None:
+            return
+        g._metrics_recorded = True
+        duration = time.perf_counter() - started
+        endpoint = request.endpoint or 'none'
+        blueprint = request.blueprint or ''
+        with self._lock:
+            self.counters[series(
+                'http_requests_total', blueprint=blueprint, endpoint=endpoint,
+                method=request.method, status=status
+            )] += 1
+            for bound in BUCKETS:
+                # Every bucket exists from the first request, even while still at zero.
+                self.counters[series(
+                    'http_request_duration_seconds_bucket', endpoint=endpoint, le=bound)] += duration <= bound
+            self.counters[series('http_request_duration_seconds_bucket', endpoint=endpoint, le='+Inf')] += 1
+            self.counters[series('http_request_duration_seconds_sum', endpoint=endpoint)] += duration
+            self.counters[series('http_request_duration_seconds_count', endpoint=endpoint)] += 1
+
+    # Process file
+
+    def start(self):
+        if self._thread is not None and self.path == self._path():
+            return
+        with self._lock:
+            if self._thread is not None and self.path == self._path():
+                return
+            if self.path != self._path():
+                # Forked from a process that already served requests: start from scratch.
+                self.counters.clear()
+                self.in_flight = 0
+            self.path = self._path()
+            self._thread = Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _path(self):
+        return os.path.join(self.directory, f'{os.getpid()}.json')
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Metrics flush failed")
+
+    def snapshot(self):
+        from . import cache, page_cache, db
+
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = {series('http_requests_in_flight'): self.in_flight}
+        counters[series('showcase_cache_hits_total')] = cache.hits
+        counters[series('showcase_cache_misses_total')] = cache.misses
+        counters[series('page_cache_hits_total')] = page_cache.hits
+        counters[series('page_cache_misses_total')] = page_cache.misses
+        with self.app.app_context():
+            pool = db.engine.pool
+        for name, method in (
+            ('db_pool_size', 'size'), ('db_pool_checked_out', 'checkedout'), ('db_pool_overflow', 'overflow')
+        ):
+            if hasattr(pool, method):
+                gauges[series(name)] = getattr(pool, method)()
+        return dict(pid=os.getpid(), counters=counters, gauges=gauges)
+
+    def flush(self):
+        if self.path is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    # Exposition
+
+    def collect(self):
+        """Sum the series of every worker, archiving the counters of dead ones."""
+        self.flush()
+        counters = defaultdict(float)
+        gauges = defaultdict(float)
+        archive_path = os.path.join(self.directory, 'archive.json')
+        with open(os.path.join(self.directory, 'archive.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(archive_path) as f:
+                    archive = json.load(f)
+            except (OSError, ValueError):
+                archive = {}
+            archived = False
+            for name in os.listdir(self.directory):
+                stem, ext = os.path.splitext(name)
+                if ext != '.json' or not stem.isdigit():
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if pid_alive(int(stem)):
+                    for key, value in data['counters'].items():
+                        counters[key] += value
+                    for key, value in data['gauges'].items():
+                        gauges[key] += value
+                else:
+                    for key, value in data['counters'].items():
+                        archive[key] = archive.get(key, 0) + value
+                    os.unlink(path)
+                    archived = True
+            if archived:
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(archive, f)
+                os.replace(tmp, archive_path)
+        for key, value in archive.items():
+            counters[key] += value
+
+        for prefix in ('showcase_cache', 'page_cache'):
+            hits = counters.get(f'{prefix}_hits_total', 0)
+            lookups = hits + counters.get(f'{prefix}_misses_total', 0)
+            gauges[f'{prefix}_hit_ratio'] = hits / lookups if lookups else 0.0
+        gauges.update(self.queue_depths())
+        return counters, gauges
+
+    def queue_depths(self):
+        from . import db
+        from .outbox.models import OutboxMessage
+        from .media.models import ImageJob
+
+        depths = {}
+        for name, model in (('mail_outbox_messages', OutboxMessage), ('image_jobs', ImageJob)):
+            rows = db.session.query(model.status, db.func.count(model.id)).group_by(model.status)
+            for status, count in rows:
+                depths[series(name, status=status)] = count
+        return depths
+
+    def render(self):
+        counters, gauges = self.collect()
+        families = defaultdict(list)
+        for key, value in (*counters.items(), *gauges.items()):
+            families[family(key)].append((key, value))
+        lines = []
+        for name in sorted(families):
+            kind, description = FAMILIES.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in sorted(families[name], key=sort_key):
+                value = int(value) if float(value).is_integer() else value
+                lines.append(f'{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def authorized(self):
+        """Scrapers present ``METRICS_TOKEN`` as a bearer token; admins may look too."""
+        authorization = request.headers.get('Authorization', '')
+        if self.token and hmac.compare_digest(authorization, f'Bearer {self.token}'):
+            return True
+        if request.remote_addr in self.allowed_ips:
+            return True
+        return current_user.is_authenticated and current_user.is_admin()
+
+    def view(self):
+        if not self.authorized():
+            abort(403)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
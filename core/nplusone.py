@@ -0,0 +1,102 @@
+"""
+N+1 query detection.
+
+Counts the statements of every request by shape; a shape executed
+``NPLUSONE_THRESHOLD`` times or more is reported with the template lines
+and the view that triggered it. Meant for development and tests, the
+stack walk is too costly for production.
+"""
+
+import os
+import re
+import sys
+import logging
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def shape(statement):
+    """Statement with whitespace and IN lists normalised."""
+    return IN_LIST.sub('(?)', WHITESPACE.sub(' ', statement).strip())
+
+
+def origin():
+    """Template lines (innermost first) and the application frame executing the query."""
+    templates = []
+    source = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            templates.append(f'{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}')
+        elif source is None and frame.f_code.co_filename.startswith(PACKAGE_DIR) \
+                and frame.f_code.co_filename != __file__:
+            source = f'{os.path.relpath(frame.f_code.co_filename, os.path.dirname(PACKAGE_DIR))}:{frame.f_lineno}'
+        frame = frame.f_back
+    return templates, source
+
+
+class QueryAuditor:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['nplusone'] = self
+        self.enabled = app.config['NPLUSONE_ENABLED']
+        if not self.enabled:
+            return
+        self.threshold = app.config['NPLUSONE_THRESHOLD']
+        self.raise_error = app.config['NPLUSONE_RAISE']
+        app.before_request(self.start)
+        app.after_request(self.report)
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def start(self):
+        g._nplusone = (Counter(), {})
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or '_nplusone' not in g:
+            return
+        counts, origins = g._nplusone
+        key = shape(statement)
+        counts[key] += 1
+        if counts[key] == self.threshold:
+            # Only walk the stack once per shape, when it becomes suspicious.
+            origins[key] = origin()
+
+    def report(self, response):
+        counts, origins = g.pop('_nplusone', (Counter(), {}))
+        findings = [
+            (count, statement, *origins[statement])
+            for statement, count in counts.most_common() if statement in origins
+        ]
+        if not findings:
+            return response
+
+        lines = [f"{len(findings)} repeated statement(s) in {request.method} {request.path}"]
+        for count, statement, templates, source in findings:
+            where = ' <- '.join(templates + [source or '?'])
+            lines.append(f"  {count}x {statement[:200]}\n     at {where}")
+        message = '\n'.join(lines)
+        if self.raise_error:
+            raise NPlusOneError(message)
+        logger.warning(message)
+        return response
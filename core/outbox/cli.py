@@ -0,0 +1,49 @@
+"""
+Outbox command line.
+"""
+
+import click
+from flask.cli import AppGroup
+
+from .. import db
+from .models import OutboxMessage
+from .worker import mail_worker
+
+
+outbox = AppGroup('outbox', help="Manage the outgoing email queue.")
+
+
+@outbox.command('drain')
+def drain():
+    """Send every due message and wait for completion."""
+    try:
+        sent = mail_worker.drain()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{sent} message(s) sent.")
+
+
+@outbox.command('retry')
+@click.option('--no-drain', is_flag=True, help="Only requeue, let the web workers send them.")
+def retry(no_drain):
+    """Queue failed messages again."""
+    count = OutboxMessage.query.filter_by(status=OutboxMessage.FAILED).update({
+        'status': OutboxMessage.PENDING,
+        'attempts': 0,
+        'next_attempt_at': db.func.now()
+    }, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"{count} message(s) queued.")
+
+    if not no_drain:
+        drain.callback()
+
+
+@outbox.command('status')
+def status():
+    """Count the messages by status."""
+    counts = db.session.query(
+        OutboxMessage.status, db.func.count(OutboxMessage.id)
+    ).group_by(OutboxMessage.status).all()
+    for name, count in sorted(counts):
+        click.echo(f"{name}: {count}")
@@ -0,0 +1,59 @@
+""" Outbox app models """
+
+from datetime import datetime
+
+from flask_mail import Message
+
+from .. import db
+
+
+class OutboxMessage(db.Model):
+    """Email waiting to be delivered by the mail worker"""
+
+    __tablename__ = 'outbox_message'
+    __table_args__ = (db.Index('ix_outbox_message_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.JSON, nullable=False)
+    text_body = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(10), index=True, nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"OutboxMessage(id={self.id!r}, subject={self.subject!r}, status={self.status!r})"
+
+    @staticmethod
+    def enqueue(subject, sender, recipients, text_body, html_body):
+        message = OutboxMessage(
+            subject=subject, sender=sender, recipients=list(recipients),
+            text_body=text_body, html_body=html_body
+        )
+        db.session.add(message)
+        return message
+
+    @staticmethod
+    def due(limit):
+        """Ids of the messages waiting to be sent, oldest first."""
+        return db.session.query(OutboxMessage.id).filter(
+            OutboxMessage.status == OutboxMessage.PENDING,
+            OutboxMessage.next_attempt_at <= datetime.utcnow()
+        ).order_by(OutboxMessage.id).limit(limit)
+
+    def to_message(self):
+        msg = Message(self.subject, sender=self.sender, recipients=self.recipients)
+        msg.body = self.text_body
+        msg.html = self.html_body
+        return msg
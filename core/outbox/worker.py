@@ -0,0 +1,239 @@
+"""
+Delivery of the mail outbox.
+
+Messages live in the ``outbox_message`` table so a spike of contact or
+reset requests costs rows, not threads. Every web process runs a single
+sender thread that claims due messages, pushes them through one SMTP
+connection kept open between batches, and spaces the sends out to stay
+under the relay's rate limit. Failed sends are retried with exponential
+backoff.
+
+Only the process holding the ``MAIL_OUTBOX_LOCK_FILE`` lock sends, so the
+rate limit holds whatever the number of gunicorn workers; the others poll
+for the lock and take over when its holder exits.
+"""
+
+import os
+import time
+import fcntl
+import atexit
+import logging
+from smtplib import SMTPServerDisconnected
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from .. import db, mail
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class MailWorker:
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._connection = None
+        self._last_used = 0.0
+        self._next_send = 0.0
+        self._wake = Event()
+        self._stopping = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['MAIL_OUTBOX_BATCH']
+        self.poll_interval = app.config['MAIL_OUTBOX_POLL']
+        self.rate = app.config['MAIL_OUTBOX_RATE']
+        self.max_attempts = app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+        self.backoff = app.config['MAIL_OUTBOX_BACKOFF']
+        self.idle_timeout = app.config['MAIL_OUTBOX_IDLE']
+        self.send_timeout = app.config['MAIL_OUTBOX_TIMEOUT']
+        self.lock_path = app.config['MAIL_OUTBOX_LOCK_FILE']
+        app.extensions['mail_worker'] = self
+        if app.config['MAIL_OUTBOX_ENABLED']:
+            # Started lazily so the thread lives in the forked gunicorn worker.
+            app.before_request(self.start)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that already ran the sender: its
+                # connection and lock belong to the parent.
+                self._connection = None
+                self._stopping.clear()
+                self.release()
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='mail-worker', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def acquire(self):
+        """Become the sending process if no other one is; True when this one is."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        lock_file, self._lock_file = self._lock_file, None
+        if lock_file is not None:
+            lock_file.close()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set() and not self.acquire():
+            self._stopping.wait(self.poll_interval)
+        if self._stopping.is_set():
+            return
+        with self.app.app_context():
+            self.recover()
+        while not self._stopping.is_set():
+            sent = 0
+            try:
+                with self.app.app_context():
+                    sent = self.step()
+            except Exception:
+                logger.exception("Mail worker iteration failed")
+                self.disconnect()
+            if sent:
+                continue
+            idle = time.monotonic() - self._last_used
+            if self._connection is not None and idle >= self.idle_timeout:
+                self.disconnect()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self.disconnect()
+        self.release()
+
+    def recover(self):
+        """Put back messages left sending by a process that died."""
+        deadline = datetime.utcnow() - timedelta(seconds=self.send_timeout)
+        OutboxMessage.query.filter(
+            OutboxMessage.status == OutboxMessage.SENDING,
+            OutboxMessage.updated_at < deadline
+        ).update({'status': OutboxMessage.PENDING}, synchronize_session=False)
+        db.session.commit()
+
+    def step(self):
+        """Claim a batch of due messages and send them over the open connection."""
+        try:
+            sent = 0
+            for message_id in self.claim(self.batch_size):
+                sent += self.deliver(message_id)
+            return sent
+        finally:
+            db.session.remove()
+
+    def claim(self, limit):
+        candidates = OutboxMessage.due(limit).all()
+        claimed = []
+        for (message_id,) in candidates:
+            updated = OutboxMessage.query.filter_by(
+                id=message_id, status=OutboxMessage.PENDING
+            ).update({
+                'status': OutboxMessage.SENDING,
+                'attempts': OutboxMessage.attempts + 1,
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+            if updated:
+                claimed.append(message_id)
+        db.session.commit()
+        return claimed
+
+    def deliver(self, message_id):
+        message = OutboxMessage.query.get(message_id)
+        self.throttle()
+        try:
+            try:
+                self.connection.send(message.to_message())
+            except SMTPServerDisconnected:
+                # The relay dropped the idle connection; open a new one once.
+                self.disconnect()
+                self.connection.send(message.to_message())
+        except Exception as e:
+            self.disconnect()
+            logger.warning("Outbox message %s failed: %s", message_id, e)
+            message.error = repr(e)
+            if message.attempts >= self.max_attempts:
+                message.status = OutboxMessage.FAILED
+            else:
+                message.status = OutboxMessage.PENDING
+                delay = self.backoff * 2 ** (message.attempts - 1)
+                message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            delivered = 0
+        else:
+            message.status = OutboxMessage.SENT
+            message.error = None
+            message.sent_at = datetime.utcnow()
+            delivered = 1
+        message.updated_at = datetime.utcnow()
+        db.session.commit()
+        return delivered
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = mail.connect().__enter__()
+        self._last_used = time.monotonic()
+        return self._connection
+
+    def disconnect(self):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def throttle(self):
+        """Space the sends ``1 / MAIL_OUTBOX_RATE`` seconds apart."""
+        if not self.rate:
+            return
+        delay = self._next_send - time.monotonic()
+        if delay > 0:
+            self._stopping.wait(delay)
+        self._next_send = max(self._next_send, time.monotonic()) + 1 / self.rate
+
+    def drain(self):
+        """Send every due message from the current process."""
+        if not self.acquire():
+            raise RuntimeError("Another process is sending the outbox.")
+        sent = 0
+        try:
+            while True:
+                batch = self.step()
+                sent += batch
+                if not batch and not self.pending():
+                    return sent
+        finally:
+            self.disconnect()
+            self.release()
+
+    def pending(self):
+        return OutboxMessage.due(1).first() is not None
+
+
+mail_worker = MailWorker()
@@ -0,0 +1,120 @@
+"""
+Password hashing.
+
+Every password goes through bcrypt with a work factor calibrated, on first
+use in each process, to the largest cost hashing within
+``PASSWORD_HASH_TARGET_MS`` on this hardware. Hashes made with a lower cost,
+or by werkzeug before this module existed, are replaced on the next
+successful login.
+
+Hashing runs in a small thread pool. When ``PASSWORD_HASH_QUEUE`` requests
+already wait for it, ``PasswordHasherBusy`` is raised at once, so a burst
+of login attempts is turned away instead of holding every worker.
+"""
+
+import os
+import time
+import logging
+from threading import BoundedSemaphore, Lock
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import bcrypt
+from werkzeug.security import check_password_hash
+
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def bcrypt_rounds(hashed):
+    """Work factor of a bcrypt hash, None for any other scheme."""
+    if not hashed or not hashed.startswith(BCRYPT_PREFIXES):
+        return None
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+
+    def __init__(self, app=None):
+        self._rounds = None
+        self._executor = None
+        self._slots = None
+        self._lock = Lock()
+        # Pool threads do not survive a fork: the child builds its own pool.
+        os.register_at_fork(after_in_child=self._forget_executor)
+        if app is not None:
+            self.init_app(app)
+
+    def _forget_executor(self):
+        self._executor = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.target_ms = app.config['PASSWORD_HASH_TARGET_MS']
+        self.min_rounds = app.config['PASSWORD_HASH_MIN_ROUNDS']
+        self.max_rounds = app.config['PASSWORD_HASH_MAX_ROUNDS']
+        self._rounds = app.config['PASSWORD_HASH_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+        app.extensions['passwords'] = self
+
+    @property
+    def rounds(self):
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    self._rounds = self.calibrate()
+        return self._rounds
+
+    def calibrate(self):
+        """Largest work factor hashing within the target latency, each round doubling the cost."""
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(self.min_rounds))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rounds = self.min_rounds
+        while rounds < self.max_rounds and elapsed_ms * 2 <= self.target_ms:
+            rounds += 1
+            elapsed_ms *= 2
+        logger.info("Password hashing calibrated to %d rounds (~%.0f ms)", rounds, elapsed_ms)
+        return rounds
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix='password-hasher')
+            return self._executor.submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(self.rounds)
+        return self._submit(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, hashed, password):
+        if not hashed:
+            return False
+        if bcrypt_rounds(hashed) is None:
+            # Hashes written by werkzeug before bcrypt was used everywhere.
+            return self._submit(check_password_hash, hashed, password)
+        return self._submit(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Hashes are only ever upgraded, so workers calibrated a round apart do not flip-flop."""
+        rounds = bcrypt_rounds(hashed)
+        return rounds is None or rounds < self.rounds
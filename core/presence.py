@@ -0,0 +1,105 @@
+"""
+Write-behind ``last_seen`` tracking.
+
+Pings only touch an in-memory buffer keeping the latest time each user was
+seen. A flusher thread writes the buffer every ``LAST_SEEN_FLUSH_INTERVAL``
+seconds, and once more at exit, in a single ``UPDATE``. A user is only
+written again once the value moved by ``LAST_SEEN_GRANULARITY`` seconds.
+"""
+
+import os
+import atexit
+import logging
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import case, or_
+
+
+logger = logging.getLogger(__name__)
+
+
+class LastSeenBuffer:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.granularity = timedelta(0)
+        self._pending = {}
+        self._seen = {}
+        self._pid = None
+        self._thread = None
+        self._stopping = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['LAST_SEEN_ENABLED']
+        self.flush_interval = app.config['LAST_SEEN_FLUSH_INTERVAL']
+        self.granularity = timedelta(seconds=app.config['LAST_SEEN_GRANULARITY'])
+        app.extensions['last_seen'] = self
+        if self.enabled:
+            app.before_request(self.start)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent flushes its own buffer.
+                self._pending.clear()
+                self._seen.clear()
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='last-seen-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def touch(self, user_id, now=None):
+        """Record that ``user_id`` was seen at ``now``."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            seen = self._seen.get(user_id)
+            if seen is not None and now - seen < self.granularity:
+                return
+            self._seen[user_id] = now
+            self._pending[user_id] = now
+        if not self.enabled:
+            self.flush()
+
+    def seen(self, user_id):
+        """Latest time this process saw ``user_id``, if it did."""
+        return self._seen.get(user_id)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Last seen flush failed")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from . import db
+        from .admin.models import User
+
+        value = case(pending, value=User.id)
+        try:
+            with self.app.app_context():
+                db.session.query(User).filter(
+                    User.id.in_(pending),
+                    or_(User.last_seen.is_(None), User.last_seen < value)
+                ).update({User.last_seen: value}, synchronize_session=False)
+                db.session.commit()
+        except Exception:
+            with self._lock:
+                for user_id, seen in pending.items():
+                    self._pending.setdefault(user_id, seen)
+            raise
+        return len(pending)
@@ -0,0 +1,135 @@
+"""
+Token-bucket rate limiting shared by the gunicorn workers.
+
+Buckets live in a small SQLite file next to the application, so every
+worker on the host draws from the same buckets without an external
+store. A rule gives each scope a bucket per client IP and, when the form
+carries one, per email address: ``capacity`` requests, refilled over
+``period`` seconds. A request goes through only when every one of its
+buckets still holds a token; otherwise it is answered with a 429 and a
+``Retry-After`` before the view runs.
+
+The client IP is ``request.remote_addr``: behind nginx, ``TRUSTED_PROXIES``
+must be set so it is the visitor's address rather than the proxy's.
+"""
+
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from functools import wraps
+
+from flask import abort, request
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    full_at REAL NOT NULL
+)
+"""
+PURGE_EVERY = 500
+
+
+class RateLimiter:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.rules = {}
+        self.path = None
+        self._local = threading.local()
+        self._hits = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.rules = app.config['RATELIMIT_RULES']
+        self.path = app.config['RATELIMIT_STORAGE']
+        app.extensions['ratelimit'] = self
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def buckets(self, scope):
+        """Key, capacity and refill rate of every bucket the current request draws from."""
+        rule = self.rules.get(scope, {})
+        keys = []
+        if 'ip' in rule:
+            keys.append((f'{scope}:ip:{request.remote_addr}', *rule['ip']))
+        email = (request.form.get('email') or '').strip().lower()
+        if email and 'email' in rule:
+            keys.append((f'{scope}:email:{email}', *rule['email']))
+        return [(key, capacity, capacity / period) for key, capacity, period in keys]
+
+    def hit(self, buckets, now=None):
+        """Take a token from every bucket, or none. Returns the seconds to wait, 0 when allowed."""
+        if not buckets:
+            return 0
+        now = now or time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            for key, capacity, rate in buckets:
+                row = connection.execute(
+                    'SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                levels.append((key, capacity, rate, tokens))
+
+            wait = max((1 - tokens) / rate for _, _, rate, tokens in levels)
+            if wait <= 0:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                    [
+                        (key, tokens - 1, now, now + (capacity - tokens + 1) / rate)
+                        for key, capacity, rate, tokens in levels
+                    ]
+                )
+            self._hits += 1
+            if self._hits % PURGE_EVERY == 0:
+                # A full bucket is the same as no bucket at all.
+                connection.execute('DELETE FROM bucket WHERE full_at <= ?', (now,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return max(wait, 0)
+
+    def check(self, scope):
+        if not self.enabled or request.method != 'POST':
+            return 0
+        try:
+            return self.hit(self.buckets(scope))
+        except sqlite3.Error:
+            # Never lock people out because the limiter store is unavailable.
+            logger.exception("Rate limiter store failed")
+            return 0
+
+
+def rate_limited(scope):
+    """Answer POSTs over the ``RATELIMIT_RULES[scope]`` buckets with a 429."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from . import limiter
+            wait = limiter.check(scope)
+            if wait:
+                abort(429, retry_after=math.ceil(wait))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
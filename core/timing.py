@@ -0,0 +1,153 @@
+"""
+Per-request timing.
+
+Every request records its wall time, the SQL statements it ran and the
+time spent rendering templates. The totals go out as a JSON log line and
+a ``Server-Timing`` header; requests slower than ``SLOW_REQUEST_THRESHOLD``
+milliseconds are logged at WARNING with their full query list. The lines
+go to ``TIMING_LOG_FILE``, or to stderr, never through the application log,
+and nowhere at all when ``TIMING_LOG`` is off.
+"""
+
+import json
+import logging
+from time import perf_counter
+from logging.handlers import WatchedFileHandler
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timing:
+    """Measurements of the current request"""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = []
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self._renders = []
+
+    @property
+    def elapsed_ms(self):
+        return (perf_counter() - self.start) * 1000
+
+    def record_query(self, statement, duration_ms):
+        self.queries.append((statement, duration_ms))
+        self.sql_ms += duration_ms
+
+
+def current_timing():
+    if has_request_context():
+        return g.get('_timing')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    timing = current_timing()
+    if timing is not None:
+        timing.record_query(statement, (perf_counter() - started) * 1000)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    connection = context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+class RequestTimer:
+
+    def __init__(self, app=None):
+        self.header = False
+        self.slow_threshold = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['request_timer'] = self
+        if not app.config['TIMING_ENABLED']:
+            return
+        self.header = app.config['SERVER_TIMING_HEADER']
+        self.slow_threshold = app.config['SLOW_REQUEST_THRESHOLD']
+        if not logger.handlers:
+            if app.config['TIMING_LOG']:
+                logger.setLevel(logging.INFO)
+                # One JSON object per line, away from the multi-line application log format.
+                path = app.config['TIMING_LOG_FILE']
+                handler = WatchedFileHandler(path) if path else logging.StreamHandler()
+                handler.setFormatter(logging.Formatter('%(message)s'))
+            else:
+                handler = logging.NullHandler()
+            logger.addHandler(handler)
+            logger.propagate = False
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+    def start(self):
+        g._timing = Timing()
+
+    def _before_render(self, sender, template, context, **extra):
+        timing = current_timing()
+        if timing is not None:
+            timing._renders.append(perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        timing = current_timing()
+        if timing is not None and timing._renders:
+            started = timing._renders.pop()
+            if not timing._renders:
+                # Nested render_template calls are already part of the outer one.
+                timing.template_ms += (perf_counter() - started) * 1000
+
+    def finish(self, response):
+        timing = current_timing()
+        if timing is None:
+            return response
+        total_ms = timing.elapsed_ms
+
+        if self.header:
+            response.headers['Server-Timing'] = ', '.join((
+                f'app;dur={total_ms:.1f}',
+                f'db;dur={timing.sql_ms:.1f};desc="{len(timing.queries)} queries"',
+                f'tpl;dur={timing.template_ms:.1f}',
+            ))
+
+        slow = self.slow_threshold is not None and total_ms >= self.slow_threshold
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            entry = dict(
+                method=request.method,
+                path=request.path,
+                endpoint=request.endpoint,
+                status=response.status_code,
+                duration_ms=round(total_ms, 2),
+                sql_count=len(timing.queries),
+                sql_ms=round(timing.sql_ms, 2),
+                template_ms=round(timing.template_ms, 2),
+            )
+            if slow:
+                entry['slow'] = True
+                entry['queries'] = [
+                    dict(statement=statement, duration_ms=round(duration, 2))
+                    for statement, duration in timing.queries
+                ]
+            logger.log(level, json.dumps(entry, ensure_ascii=False))
+        return response
+
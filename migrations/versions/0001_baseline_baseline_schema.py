@@ -0,0 +1,23 @@
+"""baseline schema
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-18 17:21:48.811914
+
+Schema created by 'flask init_db' before migrations existed: users,
+roles, category, project, storie, partner and contact. Mark an existing
+database with 'flask db stamp 0001_baseline', then 'flask db upgrade'.
+"""
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
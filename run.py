@@ -10,7 +10,7 @@ from core import create_app, db
 from core.admin.models import Role, User
 
 from dotenv import load_dotenv
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp
 from core.contact.models import Contact
 from core.main.models import Category, Project, Storie, Client
 
@@ -39,6 +39,8 @@ def init_db():
     Role.insert_roles()
     Category.insert_category()
     db.session.commit()
+    # create_all builds the latest schema, so mark it as migrated.
+    stamp()
     lg.warning('Database initialized !')
 
 